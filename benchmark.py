@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+from taor.benchmark import RESOLUTIONS, run_benchmarks, save_results, compare_results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark every generator, background change and post effect in '
+                    'isolation, and whole videos, with fixed seeds.'
+    )
+    parser.add_argument("-r", "--resolutions",
+                        help="Resolutions to benchmark. Default is 720p.",
+                        nargs="+",
+                        choices=list(RESOLUTIONS),
+                        default=["720p"])
+    parser.add_argument("-f", "--frames",
+                        help="Frames of each generator, background change and post effect "
+                             "benchmark. Default is 48.",
+                        type=int,
+                        default=48)
+    parser.add_argument("--video_frames",
+                        help="total_frames of the whole video benchmarks. "
+                             "Default is 120 and 1200.",
+                        type=int,
+                        nargs="+",
+                        default=[120, 1200])
+    parser.add_argument("--generators",
+                        help="Quantity of generators of the whole video benchmarks. "
+                             "Default is 1 and 8.",
+                        type=int,
+                        nargs="+",
+                        default=[1, 8])
+    parser.add_argument("-s", "--seed",
+                        help="Seed of every benchmark. Default is 1.",
+                        type=int,
+                        default=1)
+    parser.add_argument("--only",
+                        help="Run only the benchmarks whose name contains this text, "
+                             "like effect/ or Worm.")
+    parser.add_argument("-o", "--output",
+                        help="Save the results to this json file.")
+    parser.add_argument("-b", "--baseline",
+                        help="Compare the results with this json file, saved with --output. "
+                             "Exits with 1 if there are regressions.")
+    parser.add_argument("-t", "--threshold",
+                        help="Slowdown of the median time per frame that counts as a "
+                             "regression. Default is 0.15 (15%%).",
+                        type=float,
+                        default=0.15)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.resolutions, frames=args.frames,
+                             video_frames=args.video_frames, generators=args.generators,
+                             seed=args.seed, only=args.only)
+    if args.output:
+        save_results(results, args.output, args.seed)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print("%d regression(s) above %.0f%%" % (len(regressions), args.threshold * 100))
+            sys.exit(1)
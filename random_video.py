@@ -1,6 +1,7 @@
 import argparse
 import time
 from taor.randomvideo import random_video
+from taor.batch import render_batch, print_summary
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -29,11 +30,38 @@ if __name__ == "__main__":
                              "Default of 24*60*2 == 2880, for a 2 minutes video at 24 FPS.",
                         type=int,
                         default=24*60*2)
+    parser.add_argument("-g", "--generators",
+                        help="Quantity of generators painting at the same time in each "
+                             "video. Default is 1.",
+                        type=int,
+                        default=1)
+    parser.add_argument("-p", "--pipeline",
+                        help="Run the painting, the post effects and the encoding of the frames "
+                             "in different threads. The result is the same video.",
+                        action="store_true")
+    parser.add_argument("-j", "--jobs",
+                        help="Quantity of videos to render at the same time, each one in its "
+                             "own process. Default is 1.",
+                        type=int,
+                        default=1)
+    parser.add_argument("--segments",
+                        help="Split the frames of each video in this many segments, painted "
+                             "in parallel by different processes. Default is 1.",
+                        type=int,
+                        default=1)
+    parser.add_argument("--profile",
+                        help="Save the time spent in every phase, generator, background "
+                             "change and post effect next to each video, as json (default) "
+                             "or csv.",
+                        nargs="?",
+                        const="json",
+                        choices=["json", "csv"])
     args = parser.parse_args()
 
     seed = args.seed
     image_path = args.image_path
     frames = args.frames
+    jobs = []
     for i in range(args.quantity):
         if args.seed:
             seed = args.seed + i
@@ -46,7 +74,21 @@ if __name__ == "__main__":
             pre = args.image_path or "./results/" + str(int(time.time()))
             image_path = pre + ".avi"
 
-        random_video(file_name=image_path,
-                     debug=args.debug,
-                     seed=seed,
-                     total_frames=frames)
+        profile = None
+        if args.profile:
+            profile = "%s_profile.%s" % (image_path.rsplit(".", 1)[0], args.profile)
+
+        jobs.append(dict(file_name=image_path,
+                         debug=args.debug,
+                         seed=seed,
+                         total_frames=frames,
+                         generators_quantity=args.generators,
+                         pipeline=args.pipeline,
+                         segments=args.segments,
+                         profile=profile))
+
+    if args.jobs > 1:
+        print_summary(render_batch(jobs, args.jobs))
+    else:
+        for job in jobs:
+            random_video(**job)
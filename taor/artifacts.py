@@ -0,0 +1,425 @@
+"""
+artifacts module.
+Contains ArtifactStore, the columnar (structure of arrays) storage of the
+artifacts that are alive in a video.
+"""
+import cv2
+import numpy as np
+
+from taor.shapes import Rectangle, Circle, Ellipse
+
+# Shape kind codes
+RECTANGLE = 0
+CIRCLE = 1
+ELLIPSE = 2
+
+
+def get_extents(kind, origin, sizes):
+    """
+    get_extents
+
+    Geometric bounds (x0, y0, x1, y1) of artifacts with the given kind, origin and
+    sizes columns
+    """
+    origin = origin.astype(np.int32)
+    low = np.where((kind == RECTANGLE)[:, None], origin, origin - sizes)
+    return np.hstack([low, origin + sizes])
+
+
+def get_padding(thickness):
+    """
+    get_padding
+
+    Pixels that anti-aliasing and the outline thickness can spill outside of the
+    geometric bounds of a shape, for a thickness or an array of them
+    """
+    return np.maximum(thickness, 0) // 2 + 2
+
+
+def inside_canvas(extents, canvas_size):
+    """
+    inside_canvas
+
+    Which extents (see get_extents) touch the canvas, like BaseShape.will_paint
+    """
+    canvas_w, canvas_h = canvas_size
+    x0, y0, x1, y1 = extents.T
+    return ~((x0 > canvas_w) | (x1 < 0) | (y0 > canvas_h) | (y1 < 0))
+
+
+class ArtifactStore(object):
+    """
+    ArtifactStore class.
+    Every artifact is a row in a set of numpy arrays, so aging, death, visibility
+    culling and global movement are done with a few array operations instead of
+    walking a list of Python objects.
+
+    Columns:
+        kind: RECTANGLE, CIRCLE or ELLIPSE
+        origin: x, y. np.int16, like BaseShape.origin
+        sizes: width, height for rectangles, the axes for ellipses and
+            the radius (twice) for circles
+        color, outline: B, G, R. Only meaningful where has_color/has_outline
+        thickness, lifespan, age, dead, painted: same as in BaseShape
+
+    With sprites (a taor.sprites.SpriteCache), thick outlines of circles and ellipses
+    are painted from cached masks.
+    """
+    def __init__(self, capacity=1024, sprites=None):
+        self.sprites = sprites
+        self.size = 0
+        self.capacity = 0
+        self.kind = np.zeros(0, np.int8)
+        self.origin = np.zeros((0, 2), np.int16)
+        self.sizes = np.zeros((0, 2), np.int32)
+        self.color = np.zeros((0, 3), np.int32)
+        self.has_color = np.zeros(0, bool)
+        self.outline = np.zeros((0, 3), np.int32)
+        self.has_outline = np.zeros(0, bool)
+        self.thickness = np.zeros(0, np.int32)
+        self.lifespan = np.zeros(0, np.int32)
+        self.age = np.zeros(0, np.int32)
+        self.dead = np.zeros(0, bool)
+        self.painted = np.zeros(0, bool)
+        self.reserve(capacity)
+
+    def __len__(self):
+        return self.size
+
+    def columns(self):
+        return ['kind', 'origin', 'sizes', 'color', 'has_color', 'outline', 'has_outline',
+                'thickness', 'lifespan', 'age', 'dead', 'painted']
+
+    def reserve(self, capacity):
+        """
+        reserve
+
+        Make sure there is room for capacity rows, growing all the columns
+        to (at least) the double of the current capacity.
+        """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name in self.columns():
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def extend(self, shapes):
+        """
+        extend
+
+        Add a list of Rectangle, Circle and Ellipse objects at the end of the store,
+        or the columns of many artifacts, see extend_columns
+        """
+        if isinstance(shapes, dict):
+            self.extend_columns(shapes)
+            return
+        if not shapes:
+            return
+        self.reserve(self.size + len(shapes))
+        for i, shape in enumerate(shapes, self.size):
+            if isinstance(shape, Rectangle):
+                self.kind[i] = RECTANGLE
+                self.sizes[i] = shape.width, shape.height
+            elif isinstance(shape, Circle):
+                self.kind[i] = CIRCLE
+                self.sizes[i] = shape.radius, shape.radius
+            elif isinstance(shape, Ellipse):
+                self.kind[i] = ELLIPSE
+                self.sizes[i] = shape.axes
+            else:
+                print("ArtifactStore.extend error, shape %r not supported" % shape)
+                exit(1)
+            self.origin[i] = shape.origin
+            self.has_color[i] = bool(shape.color)
+            if shape.color:
+                self.color[i] = shape.color
+            self.has_outline[i] = bool(shape.outline)
+            if shape.outline:
+                self.outline[i] = shape.outline
+            self.thickness[i] = shape.thickness
+            self.lifespan[i] = shape.lifespan
+            self.age[i] = shape.age
+            self.dead[i] = shape.dead
+            self.painted[i] = shape.painted
+        self.size += len(shapes)
+
+    def extend_columns(self, columns):
+        """
+        extend_columns
+
+        Add many artifacts at once, without a shape object for each one. columns is a
+        dict with kind, thickness and lifespan (one value for every row, or an array),
+        origin and sizes ((n, 2) arrays, like the columns of the store) and color and
+        outline ((n, 3) arrays, or None if the artifacts have no fill or no outline).
+        Optionally has_color and has_outline, if only some rows have them.
+        """
+        quantity = len(columns['origin'])
+        if not quantity:
+            return
+        self.reserve(self.size + quantity)
+        new = slice(self.size, self.size + quantity)
+        self.kind[new] = columns['kind']
+        self.origin[new] = columns['origin']
+        self.sizes[new] = columns['sizes']
+        self.has_color[new] = columns.get('has_color', columns['color'] is not None)
+        if columns['color'] is not None:
+            self.color[new] = columns['color']
+        self.has_outline[new] = columns.get('has_outline', columns['outline'] is not None)
+        if columns['outline'] is not None:
+            self.outline[new] = columns['outline']
+        self.thickness[new] = columns['thickness']
+        self.lifespan[new] = columns['lifespan']
+        self.age[new] = 0
+        self.dead[new] = False
+        self.painted[new] = False
+        self.size += quantity
+
+    def get_extents(self, rows):
+        """
+        get_extents
+
+        Geometric bounds (x0, y0, x1, y1) of the given rows, as used by will_paint
+        """
+        return get_extents(self.kind[rows], self.origin[rows], self.sizes[rows])
+
+    def will_paint(self, canvas_size, rows):
+        """
+        will_paint
+
+        Vectorized version of BaseShape.will_paint for the given rows
+        """
+        return inside_canvas(self.get_extents(rows), canvas_size)
+
+    def get_bounds(self, rows):
+        """
+        get_bounds
+
+        Bounds (x0, y0, x1, y1), end exclusive, of the pixels the given rows can touch,
+        including the outline thickness and anti-aliasing.
+        """
+        pad = get_padding(self.thickness[rows])
+        extents = self.get_extents(rows)
+        extents[:, :2] -= pad[:, None]
+        extents[:, 2:] += pad[:, None] + 1
+        return extents
+
+    def visible_rows(self, canvas_size, start=0, stop=None):
+        """
+        visible_rows
+
+        Indices of the live rows between start and stop that are inside the canvas
+        """
+        stop = self.size if stop is None else stop
+        rows = np.arange(start, stop)
+        rows = rows[~self.dead[rows]]
+        return rows[self.will_paint(canvas_size, rows)]
+
+    def get_outline_batches(self, rows):
+        """
+        get_outline_batches
+
+        Runs of consecutive rows (start, stop), as positions in rows, of at least
+        two rectangles with only an outline, all with the same outline color and
+        thickness. cv2.polylines draws each run in a single call, with the same
+        result as one cv2.rectangle per row.
+        """
+        batchable = ((self.kind[rows] == RECTANGLE) & ~self.has_color[rows]
+                     & self.has_outline[rows])
+        style = np.hstack([self.outline[rows], self.thickness[rows][:, None]])
+        # Rows that continue the run of the previous one
+        joins = batchable[1:] & batchable[:-1] & (style[1:] == style[:-1]).all(axis=1)
+        edges = np.flatnonzero(np.diff(np.hstack([[0], joins.astype(np.int8), [0]])))
+        # edges alternate between the first join and the row after the last one
+        return [(start, stop + 1) for start, stop in zip(edges[::2], edges[1::2])]
+
+    def draw(self, img, rows, offset=(0, 0)):
+        """
+        draw
+
+        Paint the given rows on img, in order, with the same result as the
+        draw method of each shape. Runs of rectangles with the same outline and no fill
+        are drawn in a batch, see get_outline_batches.
+        """
+        if len(rows) == 0:
+            return
+        rows = np.asarray(rows)
+        origins = self.origin[rows].astype(np.int32) - offset
+        sizes = self.sizes[rows]
+        start = 0
+        for batch_start, batch_stop in self.get_outline_batches(rows):
+            self.draw_each(img, rows[start:batch_start], origins[start:batch_start],
+                           sizes[start:batch_start])
+            # Corners in the same order as cv2.rectangle
+            x0, y0 = origins[batch_start:batch_stop].T
+            x1, y1 = (origins[batch_start:batch_stop] + sizes[batch_start:batch_stop]).T
+            corners = np.stack([x0, y0, x1, y0, x1, y1, x0, y1], axis=1).reshape(-1, 4, 2)
+            row = rows[batch_start]
+            cv2.polylines(img, list(corners.astype(np.int32)), True,
+                          self.outline[row].tolist(), int(self.thickness[row]), cv2.LINE_AA)
+            start = batch_stop
+        self.draw_each(img, rows[start:], origins[start:], sizes[start:])
+
+    def draw_each(self, img, rows, origins, sizes):
+        """
+        draw_each
+
+        Paint the given rows, one or two OpenCV calls per row
+        """
+        kinds = self.kind[rows].tolist()
+        origins = origins.tolist()
+        sizes = sizes.tolist()
+        colors = self.color[rows].tolist()
+        has_colors = self.has_color[rows].tolist()
+        outlines = self.outline[rows].tolist()
+        has_outlines = self.has_outline[rows].tolist()
+        thicknesses = self.thickness[rows].tolist()
+        for kind, origin, size, color, has_color, outline, has_outline, thickness in zip(
+                kinds, origins, sizes, colors, has_colors, outlines, has_outlines, thicknesses):
+            origin = tuple(origin)
+            if kind == RECTANGLE:
+                end = (origin[0] + size[0], origin[1] + size[1])
+                if has_color:
+                    cv2.rectangle(img, origin, end, color, -1)
+                if has_outline:
+                    cv2.rectangle(img, origin, end, outline, thickness, cv2.LINE_AA)
+            elif kind == CIRCLE:
+                if has_color:
+                    cv2.circle(img, origin, size[0], color, -1, cv2.LINE_AA)
+                if has_outline and not self.draw_sprite(img, kind, origin, size, outline,
+                                                        thickness):
+                    cv2.circle(img, origin, size[0], outline, thickness, cv2.LINE_AA)
+            else:
+                if has_color:
+                    cv2.ellipse(img, origin, tuple(size), 0, 0, 360, color, -1, cv2.LINE_AA)
+                if has_outline and not self.draw_sprite(img, kind, origin, size, outline,
+                                                        thickness):
+                    cv2.ellipse(img, origin, tuple(size), 0, 0, 360, outline, thickness,
+                                cv2.LINE_AA)
+
+    def draw_sprite(self, img, kind, origin, size, color, thickness):
+        """
+        draw_sprite
+
+        Paint the outline of a circle or an ellipse from self.sprites, see SpriteCache.
+        Returns False, without painting anything, if it has to be painted by OpenCV.
+        Outlines that cross the border of img are always painted by OpenCV, it
+        rasterizes them differently near the border.
+        """
+        sprites = self.sprites
+        if sprites is None or not sprites.wants(thickness):
+            return False
+        img_height, img_width = img.shape[:2]
+        pad = int(get_padding(thickness))
+        if (origin[0] - size[0] - pad < 0 or origin[1] - size[1] - pad < 0 or
+                origin[0] + size[0] + pad >= img_width or
+                origin[1] + size[1] + pad >= img_height):
+            return False
+        if kind == CIRCLE:
+            def draw_mask(mask, center):
+                cv2.circle(mask, center, size[0], 255, thickness, cv2.LINE_AA)
+        else:
+            def draw_mask(mask, center):
+                cv2.ellipse(mask, center, tuple(size), 0, 0, 360, 255, thickness, cv2.LINE_AA)
+        sprite = sprites.get((kind, size[0], size[1], thickness), size, thickness, draw_mask)
+        if sprite is None:
+            return False
+        sprites.blend(img, sprite, origin, color)
+        return True
+
+    def repair(self, frame, background, bounds, halo, stop=None):
+        """
+        repair
+
+        Restore the background (a taor.background.Background) inside bounds and paint
+        again, in order, the live rows (before stop) that overlap it. OpenCV clips the
+        shapes to the image they are drawn on, and clipping moves their anti-aliased
+        pixels, so the rows are drawn on a scratch copy of the region padded by halo
+        pixels and grown to hold the bounds of all of them. It is only clipped by the
+        frame, so the result inside bounds is the same as a full redraw.
+        """
+        img_height, img_width = frame.shape[:2]
+        x0, y0, x1, y1 = bounds
+        rows = self.visible_rows((img_width, img_height), stop=stop)
+        ax0, ay0, ax1, ay1 = self.get_bounds(rows).T
+        overlap = (ax0 < x1) & (ax1 > x0) & (ay0 < y1) & (ay1 > y0)
+        rows = rows[overlap]
+        px0, py0, px1, py1 = x0 - halo, y0 - halo, x1 + halo, y1 + halo
+        if len(rows):
+            px0, py0 = min(px0, ax0[overlap].min()), min(py0, ay0[overlap].min())
+            px1, py1 = max(px1, ax1[overlap].max()), max(py1, ay1[overlap].max())
+        px0, py0 = max(px0, 0), max(py0, 0)
+        px1, py1 = min(px1, img_width), min(py1, img_height)
+        scratch = background.get_region(px0, py0, px1, py1)
+        self.draw(scratch, rows, offset=(px0, py0))
+        frame[y0:y1, x0:x1] = scratch[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+    def redraw(self, frame, background, rows, tiles):
+        """
+        redraw
+
+        Fill frame with the background (a taor.background.Background) and paint the
+        given rows, in strips painted at the same time by the threads of tiles (a
+        taor.tiles.TileScheduler). OpenCV clips the shapes to the image they are drawn
+        on, and clipping moves their anti-aliased pixels, so a strip only paints the
+        rows that are inside it, up to the first row that crosses its edges. The rows
+        that cross an edge, and the ones after them, are painted afterwards on the
+        whole frame, in order: the result is the same as filling frame and calling draw.
+        """
+        height = frame.shape[0]
+        _, rows_y0, _, rows_y1 = self.get_bounds(rows).T
+        # The top and bottom strips clip at the same rows as the frame
+        rows_y0 = np.maximum(rows_y0, 0)
+        rows_y1 = np.minimum(rows_y1, height)
+        strips = tiles.get_strips(height)
+        inside = [(rows_y0 >= y0) & (rows_y1 <= y1) for y0, y1 in strips]
+        crossing = ~np.logical_or.reduce(inside)
+        later = crossing.copy()
+        strip_rows = {}
+        for (y0, y1), strip_inside in zip(strips, inside):
+            first = np.flatnonzero(crossing & (rows_y0 < y1) & (rows_y1 > y0))[:1]
+            stop = first[0] if len(first) else len(rows)
+            strip_rows[y0] = rows[:stop][strip_inside[:stop]]
+            later[stop:] |= strip_inside[stop:]
+
+        def paint_strip(y0, y1):
+            background.fill(frame, y0, y1)
+            self.draw(frame[y0:y1], strip_rows[y0], offset=(0, y0))
+
+        tiles.map(paint_strip, height)
+        self.draw(frame, rows[later])
+
+    def grow_old(self):
+        """
+        grow_old
+
+        Add one frame to the age of every live row and mark as dead the ones that
+        reached their lifespan. Returns the indices of the rows that just died.
+        """
+        n = self.size
+        live = ~self.dead[:n]
+        self.age[:n][live] += 1
+        dying = np.flatnonzero(live & (self.age[:n] >= self.lifespan[:n]))
+        self.dead[dying] = True
+        return dying
+
+    def compact(self):
+        """
+        compact
+
+        Drop the dead rows, keeping the order of the live ones
+        """
+        live = np.flatnonzero(~self.dead[:self.size])
+        if len(live) == self.size:
+            return
+        for name in self.columns():
+            column = getattr(self, name)
+            column[:len(live)] = column[live]
+        self.size = len(live)
+
+    def move_yx(self, move_x, move_y):
+        self.origin[:self.size, 0] += move_x or 0
+        self.origin[:self.size, 1] += move_y or 0
@@ -0,0 +1,91 @@
+"""
+background module.
+"""
+import numpy as np
+
+
+class Background(object):
+    """
+    Background class.
+    The background of the video is almost always a plain BGR color, so it is kept
+    as a color descriptor and only turned into pixels when a BackgroundChange needs
+    to paint something else (a polygon, noise, half of a curtain...).
+
+    Frames are filled directly from the descriptor, which is cheaper than copying
+    a full frame of pixels.
+    """
+    def __init__(self, img_shape, color):
+        self.img_height, self.img_width = img_shape
+        self.color = None
+        self.pixels = None
+        # Memory kept to materialize the pixels again without allocating
+        self.buffer = None
+        self.set_color(color)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffer'] = None
+        return state
+
+    def is_solid(self):
+        return self.pixels is None
+
+    def get_color(self):
+        return self.color
+
+    def set_color(self, color):
+        """
+        set_color
+
+        Make the background a plain color, dropping its pixels
+        """
+        self.color = tuple(int(c) for c in color[:3])
+        self.pixels = None
+
+    def get_pixels(self):
+        """
+        get_pixels
+
+        The background as a frame of pixels, that can be modified in place.
+        A plain background is materialized (once) to the current color.
+        """
+        if self.pixels is None:
+            if self.buffer is None:
+                self.buffer = np.empty((self.img_height, self.img_width, 3), np.uint8)
+            self.buffer[:] = self.color
+            self.pixels = self.buffer
+            self.color = None
+        return self.pixels
+
+    def set_pixels(self, pixels):
+        self.pixels = pixels
+        self.color = None
+
+    def fill(self, frame, y0=0, y1=None):
+        """
+        fill
+
+        Paint the background on frame, that must have the same size. Only the rows
+        from y0 to y1 (end exclusive), if given.
+        """
+        if self.pixels is None:
+            frame[y0:y1] = self.color
+        else:
+            frame[y0:y1] = self.pixels[y0:y1]
+
+    def get_region(self, x0, y0, x1, y1):
+        """
+        get_region
+
+        New array with the pixels of the background inside the given bounds
+        """
+        if self.pixels is None:
+            region = np.empty((y1 - y0, x1 - x0, 3), np.uint8)
+            region[:] = self.color
+            return region
+        return self.pixels[y0:y1, x0:x1].copy()
+
+    def new_frame(self):
+        frame = np.empty((self.img_height, self.img_width, 3), np.uint8)
+        self.fill(frame)
+        return frame
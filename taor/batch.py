@@ -0,0 +1,91 @@
+"""
+batch module.
+Render several videos in parallel, each one in its own worker process.
+"""
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from taor.randomvideo import random_video
+
+
+def init_worker(opencv_threads):
+    # Several workers with all the OpenCV threads each would oversubscribe the cores
+    cv2.setNumThreads(opencv_threads)
+
+
+def render_job(job):
+    """
+    render_job
+
+    Render a single video. job holds the keyword arguments of random_video.
+    Returns a dict with the file name, seed, frames, wall time and the error, if any.
+    """
+    if not job.get('seed'):
+        # Forked workers inherit the random state of the parent, get a fresh one
+        np.random.seed()
+    start = time.time()
+    error = None
+    try:
+        random_video(**job)
+    except Exception:
+        error = traceback.format_exc()
+    return dict(
+        file_name=job['file_name'],
+        seed=job.get('seed'),
+        frames=job['total_frames'],
+        seconds=time.time() - start,
+        error=error,
+    )
+
+
+def render_batch(jobs, workers, opencv_threads=None):
+    """
+    render_batch
+
+    Render every job (keyword arguments of random_video) using a pool of workers
+    processes. Returns the results of render_job, in the same order as jobs.
+    """
+    if opencv_threads is None:
+        opencv_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    results = []
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(opencv_threads,)) as pool:
+        futures = [pool.submit(render_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # The worker died, for instance killed by the OOM killer
+                results.append(dict(file_name=job['file_name'], seed=job.get('seed'),
+                                    frames=job['total_frames'], seconds=0.0,
+                                    error=traceback.format_exc()))
+    return results
+
+
+def print_summary(results):
+    """
+    print_summary
+
+    Print a table with the wall time and frames per second of each video
+    """
+    print("=== Summary ===")
+    print("%-40s %8s %8s %10s %8s  %s" % ("file_name", "seed", "frames", "seconds", "fps",
+                                          "status"))
+    for result in results:
+        seconds = result['seconds']
+        fps = result['frames'] / seconds if seconds else 0
+        status = "FAILED" if result['error'] else "ok"
+        print("%-40s %8s %8d %10.1f %8.1f  %s" % (result['file_name'], result['seed'],
+                                                  result['frames'], seconds, fps, status))
+
+    failures = [result for result in results if result['error']]
+    print("%d videos, %d failures" % (len(results), len(failures)))
+    for result in failures:
+        print("--- %s failed:" % result['file_name'])
+        print(result['error'])
@@ -0,0 +1,302 @@
+"""
+benchmark module.
+Reproducible benchmarks of the generators, background changes and post effects
+in isolation, and of whole videos, see benchmark.py.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import taor.randomvideo as randomvideo
+from taor.artifacts import ArtifactStore
+from taor.background import Background
+from taor.bg_changes import (BackgroundFactory, ConvertChange, CurtainChange, GridChange,
+                             InstantChange, PolygonChange, RandomNoiseChange,
+                             RandomPixelChange)
+from taor.generators import Explosion, GeneratorFactory, Lasso, StainGrid, Worm
+from taor.post_effects import (BlackAndWhite, Boomerang, Brightness, ColorThreshold, Contour,
+                               GaussianBlur, GrayScale, Mirror, MirrorBox, PostEffectFactory)
+
+RESOLUTIONS = OrderedDict([
+    ("720p", (720, 1280)),
+    ("1080p", (1080, 1920)),
+    ("4k", (2160, 3840)),
+])
+FPS = 24
+# Class that each factory option creates, to name the benchmarks before creating them
+CLASSES = OrderedDict([
+    ("generator", {"l": Lasso, "x": Explosion, "s": StainGrid, "w": Worm}),
+    ("background", {"rand": RandomPixelChange, "inst": InstantChange, "conv": ConvertChange,
+                    "grid": GridChange, "cour": CurtainChange, "poly": PolygonChange,
+                    "nois": RandomNoiseChange}),
+    ("effect", {"mirr": Mirror, "mibo": MirrorBox, "gray": GrayScale, "b&w": BlackAndWhite,
+                "colt": ColorThreshold, "gaus": GaussianBlur, "brig": Brightness,
+                "cont": Contour, "boom": Boomerang}),
+])
+
+
+def one_hot(options, option):
+    return [1 if o == option else 0 for o in options]
+
+
+def summarize(name, times):
+    """
+    summarize
+
+    Result of a benchmark from the seconds each of its frames took
+    """
+    times = np.asarray(times, float)
+    return OrderedDict([
+        ("name", name),
+        ("frames", len(times)),
+        ("seconds_per_frame", float(np.median(times))),
+        ("mean_seconds_per_frame", float(times.mean())),
+        ("p90_seconds_per_frame", float(np.percentile(times, 90))),
+        ("total_seconds", float(times.sum())),
+    ])
+
+
+def get_test_frame(size, seed):
+    """
+    get_test_frame
+
+    Frame with some random shapes, the input of the post effects
+    """
+    height, width = size
+    np.random.seed(seed)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = np.random.randint(0, 256, 3).tolist()
+    for _ in range(200):
+        center = (int(np.random.randint(width)), int(np.random.randint(height)))
+        color = np.random.randint(0, 256, 3).tolist()
+        cv2.circle(frame, center, int(np.random.randint(10, 160)), color, -1, cv2.LINE_AA)
+    return frame
+
+
+def create_generator(generator_type, size, seed):
+    """
+    create_generator
+
+    Generator of the given type, see bench_generator
+    """
+    height, width = size
+    np.random.seed(seed)
+    factory = GeneratorFactory(max(height, width))
+    factory.config["p_generators"] = one_hot(factory.config["s_generators"], generator_type)
+    return (factory.create_generator(),)
+
+
+def bench_generator(generator, size, frames):
+    """
+    bench_generator
+
+    Generate and paint the artifacts of one generator, with aging and death
+    """
+    height, width = size
+    artifacts = ArtifactStore()
+    frame = np.zeros((height, width, 3), np.uint8)
+    times = []
+    for _ in range(frames):
+        started = time.perf_counter()
+        first = len(artifacts)
+        artifacts.extend(generator.generate())
+        artifacts.draw(frame, artifacts.visible_rows((width, height), start=first))
+        artifacts.grow_old()
+        artifacts.compact()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def create_bg_change(change_type, size, seed):
+    """
+    create_bg_change
+
+    Background change of the given type and the background it starts from,
+    see bench_bg_change
+    """
+    np.random.seed(seed)
+    factory = BackgroundFactory(FPS, size)
+    factory.config["p_background_change_type"] = one_hot(
+        factory.config["s_background_change_type"], change_type
+    )
+    current_color = np.random.randint(0, 256, 3).tolist()
+    change = factory.create_bg_change(current_color=current_color)
+    return change, Background(size, current_color)
+
+
+def bench_bg_change(change, background, size, frames):
+    """
+    bench_bg_change
+
+    Steps of one background change, until it finishes or after frames steps
+    """
+    times = []
+    while len(times) < frames and not change.has_finished():
+        started = time.perf_counter()
+        background = change.next_step(background)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def create_effect(effect_type, size, seed):
+    """
+    create_effect
+
+    Post effect of the given type and the frame it processes, see bench_effect
+    """
+    frame = get_test_frame(size, seed)
+    np.random.seed(seed)
+    factory = PostEffectFactory(FPS, size)
+    factory.config["p_post_effect_type"] = one_hot(
+        factory.config["s_post_efect_type"], effect_type
+    )
+    return factory.create_post_effect(), frame
+
+
+def bench_effect(effect, frame, size, frames):
+    """
+    bench_effect
+
+    Process frames with one post effect, always as a changed frame
+    """
+    dst = np.empty_like(frame)
+    times = []
+    for _ in range(min(frames, effect.get_frames())):
+        started = time.perf_counter()
+        effect.next_step(frame, dst)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def bench_video(size, total_frames, generators_quantity, seed):
+    """
+    bench_video
+
+    Whole random_video, encoding included, to a temporary file. Only the total
+    time is measured, seconds_per_frame is its average.
+    """
+    height, width = size
+    saved = dict(randomvideo.config)
+    randomvideo.config.update(img_height=height, img_width=width)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "benchmark.avi")
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                randomvideo.random_video(file_name, seed=seed, total_frames=total_frames,
+                                         generators_quantity=generators_quantity)
+            seconds = time.perf_counter() - started
+    finally:
+        randomvideo.config.clear()
+        randomvideo.config.update(saved)
+    return OrderedDict([
+        ("name", ""),
+        ("frames", total_frames),
+        ("seconds_per_frame", seconds / total_frames),
+        ("total_seconds", seconds),
+        ("fps", total_frames / seconds),
+    ])
+
+
+def run_benchmarks(resolutions, frames=48, video_frames=(120, 1200), generators=(1, 8),
+                   seed=1, only=None):
+    """
+    run_benchmarks
+
+    Run every benchmark for the given resolutions (keys of RESOLUTIONS).
+    Returns an OrderedDict of results by name, like "effect/GaussianBlur/720p".
+    only, if given, is a substring the names must contain.
+    """
+    results = OrderedDict()
+
+    def selected(name):
+        return only is None or only in name
+
+    for resolution in resolutions:
+        size = RESOLUTIONS[resolution]
+        micro = [
+            ("generator", create_generator, bench_generator,
+             GeneratorFactory(1).config["s_generators"]),
+            ("background", create_bg_change, bench_bg_change,
+             BackgroundFactory(FPS, size).config["s_background_change_type"]),
+            ("effect", create_effect, bench_effect,
+             PostEffectFactory(FPS, size).config["s_post_efect_type"]),
+        ]
+        for kind, create, bench, types in micro:
+            for option in types:
+                name = "%s/%s/%s" % (kind, CLASSES[kind][option].__name__, resolution)
+                if selected(name):
+                    # The benchmarked object and its inputs
+                    subject = create(option, size, seed)
+                    results[name] = summarize(name, bench(*subject, size, frames))
+                    print_result(results[name])
+
+        for total_frames in video_frames:
+            for generators_quantity in generators:
+                name = "video/%dframes/%dgenerators/%s" % (total_frames, generators_quantity,
+                                                           resolution)
+                if selected(name):
+                    result = bench_video(size, total_frames, generators_quantity, seed)
+                    result["name"] = name
+                    results[name] = result
+                    print_result(result)
+    return results
+
+
+def print_result(result):
+    print("%-45s %10.3f ms/frame" % (result["name"], result["seconds_per_frame"] * 1000))
+
+
+def get_environment():
+    return OrderedDict([
+        ("python", platform.python_version()),
+        ("numpy", np.__version__),
+        ("opencv", cv2.__version__),
+        ("machine", platform.machine()),
+        ("processor", platform.processor()),
+        ("cpus", os.cpu_count()),
+    ])
+
+
+def save_results(results, file_name, seed):
+    with open(file_name, "w") as output:
+        json.dump(OrderedDict([
+            ("environment", get_environment()),
+            ("seed", seed),
+            ("results", results),
+        ]), output, indent=2)
+
+
+def compare_results(results, baseline, threshold):
+    """
+    compare_results
+
+    Print the change of every result against the baseline (a saved results file).
+    A result is a regression if its median time per frame (the average for whole
+    videos) is more than threshold (a fraction) slower. Returns the names of the regressions.
+    """
+    base_results = baseline["results"]
+    regressions = []
+    print("%-45s %10s %10s %8s" % ("benchmark", "baseline", "current", "change"))
+    for name, result in results.items():
+        if name not in base_results:
+            print("%-45s %10s %10.3f" % (name, "-", result["seconds_per_frame"] * 1000))
+            continue
+        before = base_results[name]["seconds_per_frame"]
+        now = result["seconds_per_frame"]
+        change = now / before - 1 if before else 0.0
+        mark = ""
+        if change > threshold:
+            mark = "REGRESSION"
+            regressions.append(name)
+        print("%-45s %10.3f %10.3f %+7.1f%% %s" % (name, before * 1000, now * 1000,
+                                                   change * 100, mark))
+    return regressions
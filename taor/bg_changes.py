@@ -3,6 +3,7 @@ from numpy.random import choice, randint
 
 from taor.shapes import Polygon
 from taor.color_factory import ColorFactory
+from taor.noise import NoiseSource
 
 
 class BackgroundFactory(object):
@@ -19,6 +20,8 @@ class BackgroundFactory(object):
             ],
             # p_background_change_type=[1, 0, 0, 0, 0, 0, 0],
             p_background_change_type=None,
+            # Noise frames pre-generated by "nois" changes, 0 generates every frame
+            noise_bank_size=0,
         )
         self.fps = fps
         self.color_factory = ColorFactory()
@@ -59,7 +62,8 @@ class BackgroundFactory(object):
         elif bg_change == "nois":
             change = RandomNoiseChange(self.fps,
                                        shape,
-                                       target_color)
+                                       target_color,
+                                       bank_size=self.config["noise_bank_size"])
         else:
             print("BG change type %r not supported yet" % bg_change)
             exit(1)
@@ -67,6 +71,11 @@ class BackgroundFactory(object):
 
 
 class BackgroundChange(object):
+    """
+    Abstract Class.
+    Each call to next_step(background) updates a taor.background.Background in place
+    (and returns it). Changes leave the background as a plain target_color when they finish.
+    """
     def __init__(self, fps, img_shape, target_color, current_color=None):
         self.img_height, self.img_width = img_shape
         self.fps = fps
@@ -97,12 +106,16 @@ class SliceChange(BackgroundChange):
     each frame.
         frame[slice_y, slice_x, :] = self.target_color
 
-    Each implementation is responsible to create the slice depending on the
-    type of change. For instance:
+    Each implementation is responsible to create the slices depending on the
+    type of change, and give them in order to set_slices. For instance:
         - Random pixels
         - Divide the frame into a grid
         - etc
 
+    The slices are not kept, they are compiled into self.rank, a "reveal rank" map
+    with the index of the first slice that covers each pixel. Applying the first
+    k slices is then a single masked assignment: frame[self.rank < k] = target_color
+
     The property self.points_per_frame rules how many of this slices should be changed
     each frame. For instance, if the slices are individual coordinates of pixels, we want
     to change several each frame, other wise it would take too long to convert all the pixels.
@@ -110,21 +123,46 @@ class SliceChange(BackgroundChange):
     def __init__(self, fps, img_shape, target_color, current_color=None):
         super().__init__(fps, img_shape, target_color, current_color=current_color)
         self.points_per_frame = 1
-
-    def next_step(self, frame):
-        if len(self.coordinates) > 0:
-            for _ in range(self.points_per_frame):
-                if len(self.coordinates) > 0:
-                    sy, sx = self.coordinates[0]
-                    frame[sy, sx, :] = self.target_color[:3]
-                    self.coordinates = self.coordinates[1:]
-                else:
-                    self.working = False
-                    self.finished = True
+        self.slices = 0
+        self.revealed = 0
+        self.rank = None
+
+    def get_rank_dtype(self):
+        # Smallest integer type that can hold every rank plus the "never" value
+        return np.min_scalar_type(self.slices)
+
+    def set_slices(self, slices):
+        """
+        set_slices
+
+        Compile the list of (slice_y, slice_x) pairs, in the order they should be
+        applied, into self.rank
+        """
+        self.slices = len(slices)
+        self.rank = np.full((self.img_height, self.img_width), self.slices,
+                            dtype=self.get_rank_dtype())
+        # Backwards, so a pixel covered by several slices keeps the first one
+        for index in range(self.slices - 1, -1, -1):
+            sy, sx = slices[index]
+            self.rank[sy, sx] = index
+
+    def next_step(self, background):
+        if self.revealed < self.slices:
+            revealed = min(self.revealed + self.points_per_frame, self.slices)
+            if revealed == self.slices:
+                # Every pixel is covered by some slice
+                background.set_color(self.target_color)
+            else:
+                background.get_pixels()[self.rank < revealed] = self.target_color[:3]
+            # Finished if there were not enough slices left for the whole step
+            if self.revealed + self.points_per_frame > self.slices:
+                self.working = False
+                self.finished = True
+            self.revealed = revealed
         else:
             self.working = False
             self.finished = True
-        return frame
+        return background
 
 
 class InstantChange(SliceChange):
@@ -135,15 +173,16 @@ class InstantChange(SliceChange):
     """
     def __init__(self, fps, img_shape, target_color):
         super().__init__(fps, img_shape, target_color)
-        self.coordinates = [[slice(0, self.img_height+1),
-                             slice(0, self.img_width+1)]]
+        self.set_slices([[slice(0, self.img_height+1),
+                          slice(0, self.img_width+1)]])
 
 
 class RandomPixelChange(SliceChange):
     """
-    RandomPixelChange creates an array of all the possible pixel coordinates
-    and shuffles them. It also picks randomly how many of these shuffled coordinates
-    should be changed to target_color each frame.
+    RandomPixelChange shuffles all the possible pixel coordinates (column by column)
+    and picks randomly how many of these shuffled coordinates should be changed
+    to target_color each frame.
+    Each pixel is a slice, so the rank map is built directly from the shuffled order.
     """
     def __init__(self, fps, img_shape, target_color):
         super().__init__(fps, img_shape, target_color)
@@ -151,12 +190,15 @@ class RandomPixelChange(SliceChange):
         min_ppf = (self.img_width * self.img_height) / (self.fps * 5)
         self.points_per_frame = randint(min_ppf, max_ppf+1)
 
-        coordinates = []
-        for w in range(self.img_width):
-            for h in range(self.img_height):
-                coordinates.append([slice(h, h+1), slice(w, w+1)])
-        self.coordinates = np.array(coordinates)
-        np.random.shuffle(self.coordinates)
+        self.slices = self.img_width * self.img_height
+        dtype = self.get_rank_dtype()
+        # Same random numbers as shuffling the list of coordinates
+        order = np.arange(self.slices, dtype=dtype)
+        np.random.shuffle(order)
+        rank = np.empty(self.slices, dtype=dtype)
+        rank[order] = np.arange(self.slices, dtype=dtype)
+        # The coordinates were ordered by column (x) and then by row (y)
+        self.rank = np.ascontiguousarray(rank.reshape(self.img_width, self.img_height).T)
 
 
 class GridChange(SliceChange):
@@ -188,8 +230,9 @@ class GridChange(SliceChange):
 
                 coordinates.append([slice(int(y_initial), int(y_final+1)),
                                     slice(int(x_initial), int(x_final+1))])
-        self.coordinates = np.array(coordinates)
-        np.random.shuffle(self.coordinates)
+        order = np.arange(len(coordinates))
+        np.random.shuffle(order)
+        self.set_slices([coordinates[i] for i in order])
 
 
 class CurtainChange(SliceChange):
@@ -224,9 +267,9 @@ class CurtainChange(SliceChange):
                 coordinates.append([slice(0, self.img_height + 1),
                                     slice(r, r+self.lines_per_frame)])
 
-        self.coordinates = np.array(coordinates)
         if direction in ["du", "rl"]:
-            self.coordinates = self.coordinates[::-1]
+            coordinates = coordinates[::-1]
+        self.set_slices(coordinates)
 
 
 class ConvertChange(BackgroundChange):
@@ -234,6 +277,7 @@ class ConvertChange(BackgroundChange):
     Gradually change the current color to target color.
     First calculates the deltas per channel and
     divides this delta by the number of frames it should take.
+    The background stays a plain color, only the color is interpolated.
     """
     def __init__(self, fps, img_shape, target_color, current_color):
         super().__init__(fps, img_shape, target_color, current_color)
@@ -246,21 +290,22 @@ class ConvertChange(BackgroundChange):
                   target_color[1] - current_color[1],
                   target_color[2] - current_color[2])
         self.change_per_frame = np.array(deltas)/self.frames
-        self.pseudo_frame = np.zeros((self.img_height, self.img_width, 3), np.float16)
-        self.pseudo_frame[:, :] = self.current_color[:3]
+        # Same float16 rounding as the one a full frame of float16 pixels would have
+        self.pseudo_color = np.zeros(3, np.float16)
+        self.pseudo_color[:] = self.current_color[:3]
 
-    def next_step(self, frame):
+    def next_step(self, background):
         if self.frame < self.frames:
-            self.pseudo_frame[:, :] += self.change_per_frame
-            self.pseudo_frame[self.pseudo_frame > 255] = 255
-            frame = self.pseudo_frame.round().astype(np.uint8)
+            self.pseudo_color += self.change_per_frame
+            self.pseudo_color[self.pseudo_color > 255] = 255
+            background.set_color(self.pseudo_color.round().astype(np.uint8))
             self.frame += 1
         else:
             # cleanup, finish the job
-            frame[:] = self.target_color[:3]
+            background.set_color(self.target_color)
             self.working = False
             self.finished = True
-        return frame
+        return background
 
 
 class PolygonChange(BackgroundChange):
@@ -306,8 +351,9 @@ class PolygonChange(BackgroundChange):
                              list(np.int32(self.pseudo_points[2:])),
                              target_color)
 
-    def next_step(self, frame):
+    def next_step(self, background):
         if self.frame < self.frames:
+            frame = background.get_pixels()
             frame[:] = self.current_color[:3]
             self.shape.draw(frame)
             self.pseudo_points += self.change_per_frame
@@ -315,10 +361,10 @@ class PolygonChange(BackgroundChange):
             self.frame += 1
         else:
             # cleanup, finish the job
-            frame[:] = self.target_color[:3]
+            background.set_color(self.target_color)
             self.working = False
             self.finished = True
-        return frame
+        return background
 
 
 class RandomNoiseChange(BackgroundChange):
@@ -326,8 +372,9 @@ class RandomNoiseChange(BackgroundChange):
     Creates frames of random color noise before chaning to the target color.
     Some frames are marked as 'flash_frames', which are special frames where
     the noise remains static.
+    The noise comes from a NoiseSource with its own seed, drawn from the global RNG.
     """
-    def __init__(self, fps, img_shape, target_color):
+    def __init__(self, fps, img_shape, target_color, bank_size=0):
         super().__init__(fps, img_shape, target_color)
         min_frames = self.fps * 3
         max_frames = self.fps * 6
@@ -338,6 +385,7 @@ class RandomNoiseChange(BackgroundChange):
                                         self.frames,
                                         randint(round(self.fps/2), self.fps*2)
                                         )
+        self.noise = NoiseSource(img_shape, randint(2**31), bank_size=bank_size)
 
     def __repr__(self):
         return "BackgroundChange of type %s. To %r From %r. Do flash = %r" \
@@ -346,14 +394,14 @@ class RandomNoiseChange(BackgroundChange):
                   self.current_color,
                   self.flash_frames)
 
-    def next_step(self, frame):
+    def next_step(self, background):
         if self.frame < self.frames:
             if self.frame not in self.flash_frames:
-                frame = randint(0, 256, (self.img_height, self.img_width, 3), dtype=np.uint8)
+                background.set_pixels(self.noise.next_frame())
             self.frame += 1
         else:
             # cleanup, finish the job
-            frame[:] = self.target_color[:3]
+            background.set_color(self.target_color)
             self.working = False
             self.finished = True
-        return frame
+        return background
@@ -1,9 +1,33 @@
 import pprint
+from collections import OrderedDict
+from time import perf_counter
+
 import numpy as np
 from numpy.random import choice, randint
 
+from taor.artifacts import RECTANGLE, CIRCLE, ELLIPSE
 from taor.shapes import BaseShape, Rectangle, Circle, Ellipse
 from taor.color_factory import ColorFactory
+from taor.random_stream import RandomStream
+
+
+def get_shape_sizes(kinds, sizes):
+    """
+    get_shape_sizes
+
+    Sizes like ArtifactStore.sizes from planned sizes (size and size_2), with the same
+    conversions as the constructors of the shapes. kinds is one kind for all of them
+    or an array with the kind of each one
+    """
+    sizes = np.array(sizes)
+    kinds = np.broadcast_to(kinds, len(sizes))
+    rectangles = kinds == RECTANGLE
+    circles = kinds == CIRCLE
+    ellipses = kinds == ELLIPSE
+    sizes[rectangles, 1] = sizes[rectangles, 0]
+    sizes[circles] = np.round(sizes[circles, :1] / 2)
+    sizes[ellipses] //= 2
+    return sizes
 
 
 class GeneratorFactory(object):
@@ -19,7 +43,10 @@ class GeneratorFactory(object):
             # p_generators=[0.35, 0.15, 0.15, 0.35],  # custom probabilities for each
             # p_generators=[0, 0, 1, 0],  # use only one of them
             p_generators=None,  # same probabilities for all
-            max_thickness=10
+            max_thickness=10,
+            # Frames Explosion and StainGrid take to emit their quantity of artifacts,
+            # many per frame, and one per frame after it. None for one artifact per frame
+            burst_frames=None,
         )
 
     def get_random_coordinate(self):
@@ -90,10 +117,26 @@ class GeneratorFactory(object):
                   "generator_type %s not supported" % generator_type)
             exit(0)
 
+        if self.config['burst_frames'] and 'quantity' in generator.s:
+            generator.s['burst'] = -(-generator.s['quantity'] // self.config['burst_frames'])
+
         return generator
 
 
 class Generator(BaseShape):
+    SHAPE_KINDS = {"rectangle": RECTANGLE, "circle": CIRCLE, "ellipse": ELLIPSE}
+    # x, y steps of the 8 directions
+    DELTAS = [
+        [-1, -1],
+        [0, -1],
+        [1, -1],
+        [1, 0],
+        [1, 1],
+        [0, 1],
+        [-1, 1],
+        [-1, 0]
+    ]
+
     def __init__(self, origin, color, outline=None, thickness=1):
         super().__init__(origin, color, outline=None, thickness=thickness)
 
@@ -138,8 +181,18 @@ class Generator(BaseShape):
         self.s['shakiness'] = randint(1, int(self.s['size']/2))
 
         self.s['lifespan'] = randint(24*3, 24*30)
+        # Steps per call to generate, see GeneratorFactory.config['burst_frames']
+        self.s['burst'] = 1
         self.finished = False
         self.step = 0
+        # The decisions of every step come from this stream, sampled in blocks
+        self.random = RandomStream(randint(2**31))
+        # Steps are planned plan_size at a time, see plan. planned_used of them
+        # are already generated and planned_steps counts all the steps planned so far
+        self.plan_size = 256
+        self.planned = None
+        self.planned_used = 0
+        self.planned_steps = 0
 
     def __str__(self):
         return "Generator %s with origin = %r and config %s" % (
@@ -155,97 +208,240 @@ class Generator(BaseShape):
     def validate_cc(self, component):
         return min(max(component, 0), 255)
 
-    def adjust_color(self, color):
-        if not color:
-            return
-
-        nb, ng, nr = color
-        if self.s['change_color']:
-            jump = self.s['color_jump']
-            # Change all the channels at unison or separated
-            if self.s['change_color_unison']:
-                delta = randint(-jump, jump+1)
-                nb = self.validate_cc(nb + delta)
-                nr = self.validate_cc(nr + delta)
-                ng = self.validate_cc(ng + delta)
-            else:
-                if choice([False, True], p=self.s['p_change_color_every_step']):
-                    nb = self.validate_cc(nb + randint(-jump, jump + 1))
-                if choice([False, True], p=self.s['p_change_color_every_step']):
-                    nr = self.validate_cc(nr + randint(-jump, jump + 1))
-                if choice([False, True], p=self.s['p_change_color_every_step']):
-                    ng = self.validate_cc(ng + randint(-jump, jump + 1))
-
-        # if self.s['change_alpha']:
-        #     if choice([False, True], p=self.s['p_change_alpha_every_step']):
-        #         alpha = self.validate_cc(
-        #             alpha + randint(-self.s['alpha_jump'], self.s['alpha_jump'])
-        #         )
-        # return nb, ng, nr, alpha  # OpenCV does not have alpha
-        return nb, ng, nr
+    def walk_color(self, color, n, name):
+        """
+        walk_color
 
-    def new_step(self):
-        # SHAKINESS
-        x, y = self.origin
+        (n, 3) array with the colors of the next n steps (None if color is None),
+        starting from color and changed as self.s says. Takes the decisions of all of
+        them at once, with name as prefix so the color and the outline walks do not
+        share them.
+        """
+        if not color:
+            return None
+        if not self.s['change_color']:
+            return np.tile(np.array(color, int), (n, 1))
+
+        jump = self.s['color_jump']
+        # Change all the channels at unison or separated
+        if self.s['change_color_unison']:
+            deltas = self.random.integer(name + '_jump', -jump, jump+1, size=n)
+            deltas = np.repeat(deltas[:, None], 3, axis=1)
+        else:
+            # Blue, red and green, in this order
+            changed = self.random.choice('change_' + name, [False, True],
+                                         p=self.s['p_change_color_every_step'],
+                                         size=3*n).reshape(n, 3)
+            deltas = np.zeros((n, 3), int)
+            deltas[changed] = self.random.integer(name + '_jump', -jump, jump+1,
+                                                  size=changed.sum())
+            deltas = deltas[:, [0, 2, 1]]
+
+        # The walk is clipped on every step (like validate_cc), so it is not a cumulative sum
+        channels = []
+        for component, component_deltas in zip(color, deltas.T.tolist()):
+            components = []
+            for delta in component_deltas:
+                component += delta
+                if component < 0:
+                    component = 0
+                elif component > 255:
+                    component = 255
+                components.append(component)
+            channels.append(components)
+        return np.array(channels).T
+
+    def plan(self, n):
+        """
+        plan
+
+        Take the random decisions of the next n steps at once. Returns an OrderedDict
+        of arrays with a row per step: shake (offset from the origin), color,
+        outline, sizes (size and size_2) and move (x, y to add to the origin after
+        the step) if the generator plans its moves, see plan_moves. color and outline
+        are None if the generator has no fill or no outline. self.s,
+        self.color and self.outline are left as they are after the n steps.
+        """
+        planned = OrderedDict()
         if self.s['use_shakiness']:
-            x += randint(-self.s['shakiness'], self.s['shakiness']+1)
-            y += randint(-self.s['shakiness'], self.s['shakiness']+1)
-        self.paint_coordinates = [x, y]
+            shake = self.random.integer('shakiness', -self.s['shakiness'],
+                                        self.s['shakiness']+1, size=2*n)
+            planned['shake'] = shake.reshape(n, 2)
+        else:
+            planned['shake'] = np.zeros((n, 2), int)
 
-        # CHANGE COLOR
-        self.color = self.adjust_color(self.color)
-        self.outline = self.adjust_color(self.outline)
+        planned['color'] = self.walk_color(self.color, n, 'color')
+        planned['outline'] = self.walk_color(self.outline, n, 'outline')
+        if planned['color'] is not None:
+            self.color = tuple(planned['color'][-1].tolist())
+        if planned['outline'] is not None:
+            self.outline = tuple(planned['outline'][-1].tolist())
 
-        # CHANGE SIZE
         if self.s['change_size_every_step']:
-            self.s['size'] = randint(self.s['min_size'], self.s['max_size'])
-            self.s['size_2'] = randint(self.s['min_size'], self.s['max_size'])
+            sizes = self.random.integer('size', self.s['min_size'], self.s['max_size'],
+                                        size=2*n)
+            planned['sizes'] = sizes.reshape(n, 2)
+            self.s['size'], self.s['size_2'] = planned['sizes'][-1].tolist()
+        else:
+            planned['sizes'] = np.tile([self.s['size'], self.s['size_2']], (n, 1))
+
+        moves = self.plan_moves(n)
+        if moves is not None:
+            planned['move'] = moves
+        return planned
+
+    def plan_moves(self, n):
+        """
+        plan_moves
+
+        (n, 2) array with the moves of the next n steps, or None if the generator
+        does not move by steps that can be planned, see move_group
+        """
+        return None
+
+    def get_plan(self, n):
+        """
+        get_plan
+
+        Plan of the next n steps, planning more of them if needed
+        """
+        used = self.planned_used
+        remaining = len(self.planned['shake']) - used if self.planned else 0
+        if remaining < n:
+            planned = self.plan(max(n - remaining, self.plan_size))
+            self.planned_steps += len(planned['shake'])
+            if self.planned:
+                for name, values in planned.items():
+                    if values is not None:
+                        planned[name] = np.concatenate([self.planned[name][used:], values])
+            self.planned = planned
+            self.planned_used = used = 0
+        return OrderedDict(
+            (name, None if values is None else values[used:used + n])
+            for name, values in self.planned.items()
+        )
+
+    def take_step(self):
+        """
+        take_step
+
+        Mark the next planned step as generated. Returns its index in self.planned,
+        valid until the next call.
+        """
+        if not self.planned or self.planned_used == len(self.planned['shake']):
+            self.get_plan(1)
+        self.planned_used += 1
+        self.step += 1
+        return self.planned_used - 1
+
+    def new_step(self):
+        i = self.take_step()
+        planned = self.planned
+        color = None if planned['color'] is None else tuple(planned['color'][i].tolist())
+        outline = None if planned['outline'] is None else tuple(planned['outline'][i].tolist())
+        size, size_2 = planned['sizes'][i].tolist()
+
+        # SHAKINESS
+        x, y = self.origin
+        dx, dy = planned['shake'][i].tolist()
+        self.paint_coordinates = [x + dx, y + dy]
 
         if self.s['shape'] == "circle":
             points = self.paint_coordinates
-            if self.color:
-                r = Circle(points, self.s['size'], self.color, self.outline, -1)
+            if color:
+                r = Circle(points, size, color, outline, -1)
             else:
-                r = Circle(points, self.s['size'], self.color, self.outline, self.thickness)
+                r = Circle(points, size, color, outline, self.thickness)
         if self.s['shape'] == "rectangle":
-            sizes = (self.s['size'], self.s['size'])
-            if self.color:
+            sizes = (size, size)
+            if color:
                 r = Rectangle(
-                    self.paint_coordinates, sizes, self.color, self.outline, -1
+                    self.paint_coordinates, sizes, color, outline, -1
                 )
             else:
                 r = Rectangle(
-                    self.paint_coordinates, sizes, self.color, self.outline, self.thickness
+                    self.paint_coordinates, sizes, color, outline, self.thickness
                 )
 
         if self.s['shape'] == "ellipse":
-            sizes = (self.s['size'], self.s['size_2'])
-            if self.color:
+            sizes = (size, size_2)
+            if color:
                 r = Ellipse(
-                    self.paint_coordinates, sizes, self.color, self.outline, -1
+                    self.paint_coordinates, sizes, color, outline, -1
                 )
             else:
                 r = Ellipse(
-                    self.paint_coordinates, sizes, self.color, self.outline, self.thickness
+                    self.paint_coordinates, sizes, color, outline, self.thickness
                 )
         # print(r)
         r.lifespan = self.s['lifespan']
-        self.step += 1
         return r
 
+    def move(self):
+        """
+        move
+
+        Move the origin after a step
+        """
+        self.move_group([self])
+
+    @classmethod
+    def move_group(cls, generators):
+        """
+        move_group
+
+        Move the origin of many generators of this class after a step, see
+        GeneratorBatch. By default adds the planned move of the step, so
+        move_origin only changes where the path goes on.
+        """
+        for generator in generators:
+            dx, dy = generator.planned['move'][generator.planned_used - 1].tolist()
+            origin = generator.origin
+            origin[0] += dx
+            origin[1] += dy
+
+    def generate(self):
+        artifacts = []
+        artifacts.append(self.new_step())
+        self.move()
+        return artifacts
+
+    def emit(self, origins):
+        """
+        emit
+
+        Take the next len(origins) planned steps, painted at origins plus their shake.
+        Returns the columns of their artifacts (see ArtifactStore.extend_columns), the
+        same artifacts that as many calls to new_step would create, without an object
+        for each one.
+        """
+        planned = self.get_plan(len(origins))
+        self.planned_used += len(origins)
+        self.step += len(origins)
+        filled = planned['color'] is not None
+        return OrderedDict([
+            ("kind", self.SHAPE_KINDS[self.s['shape']]),
+            ("origin", (np.asarray(origins) + planned['shake']).astype(np.int16)),
+            ("sizes", get_shape_sizes(self.SHAPE_KINDS[self.s['shape']], planned['sizes'])),
+            ("color", planned['color']),
+            ("outline", planned['outline']),
+            ("thickness", -1 if filled else self.thickness),
+            ("lifespan", self.s['lifespan']),
+        ])
+
+    def get_burst(self):
+        """
+        get_burst
+
+        Steps of the next generate: s['burst'] until s['quantity'] artifacts are
+        emitted (the last one takes what is left), one per frame after that
+        """
+        # Every artifact is a step, so self.step counts the ones emitted so far
+        return max(min(self.s['burst'], self.s['quantity'] - self.step), 1)
+
     @classmethod
     def get_delta(cls, direction):
-        deltas = [
-            [-1, -1],
-            [0, -1],
-            [1, -1],
-            [1, 0],
-            [1, 1],
-            [0, 1],
-            [-1, 1],
-            [-1, 0]
-        ]
-        return deltas[direction]
+        return cls.DELTAS[direction]
 
 
 class LineGenerator(Generator):
@@ -257,6 +453,33 @@ class LineGenerator(Generator):
         self.s['space_jump'] = randint(1, self.s['max_space_jump']+1)
         self.s['change_space_jump_every_step'] = choice([False, True], p=[0.7, 0.3])
 
+    def plan_space_jumps(self, n):
+        if self.s['change_space_jump_every_step']:
+            jumps = self.random.integer('space_jump', 1, self.s['max_space_jump']+1, size=n)
+            self.s['space_jump'] = jumps[-1].item()
+            return jumps
+        return np.full(n, self.s['space_jump'])
+
+    def lookahead(self, n):
+        """
+        lookahead
+
+        Parameters of the next n artifacts, without generating them. OrderedDict with
+        origin (n, 2, as painted), sizes (n, 2, like ArtifactStore.sizes), and color
+        and outline ((n, 3) arrays or None). The origins are right until
+        move_origin is called, the rest of the plan does not depend on the origin.
+        """
+        planned = self.get_plan(n)
+        moves = planned['move'][:-1]
+        # cumsum adds one move after the other, like generate does
+        origins = np.cumsum(np.vstack([[self.origin], moves]), axis=0)
+        return OrderedDict([
+            ("origin", (origins + planned['shake']).astype(np.int16)),
+            ("sizes", get_shape_sizes(self.SHAPE_KINDS[self.s['shape']], planned['sizes'])),
+            ("color", planned['color']),
+            ("outline", planned['outline']),
+        ])
+
 
 class Worm(LineGenerator):
     def __init__(self, origin, color, outline=None, thickness=1):
@@ -275,22 +498,14 @@ class Worm(LineGenerator):
         # initial state
         self.direction = randint(0, 8)
 
-    def generate(self):
-        artifacts = []
-        artifacts.append(self.new_step())
-
-        delta = choice(self.s['s_change_direction'],
-                       p=self.s['p_change_direction'])
-        delta *= choice([-1, 1])
-        self.direction = (self.direction + delta) % 8
-        delta = Generator.get_delta(self.direction)
-
-        if self.s['change_space_jump_every_step']:
-            self.s['space_jump'] = randint(1, self.s['max_space_jump']+1)
-
-        self.origin[0] += delta[0] * self.s['space_jump']
-        self.origin[1] += delta[1] * self.s['space_jump']
-        return artifacts
+    def plan_moves(self, n):
+        turns = self.random.choice('change_direction', self.s['s_change_direction'],
+                                   p=self.s['p_change_direction'], size=n)
+        turns = turns * self.random.choice('direction_sign', [-1, 1], size=n)
+        directions = (self.direction + np.cumsum(turns)) % 8
+        self.direction = directions[-1].item()
+        deltas = np.array(Generator.DELTAS)[directions]
+        return deltas * self.plan_space_jumps(n)[:, None]
 
 
 class Lasso(LineGenerator):
@@ -313,31 +528,25 @@ class Lasso(LineGenerator):
         self.s['reset_every_frames'] = randint(96, 480)
         # pprint.pprint(self.s)
 
-    def generate(self):
-        artifacts = []
-        artifacts.append(self.new_step())
-
-        delta = [
-            np.cos(np.radians(self.s['direction'])),
-            np.sin(np.radians(self.s['direction'])),
-        ]
+    def plan_moves(self, n):
+        turns = self.random.choice('change_direction', self.s['s_change_direction'],
+                                   p=self.s['p_change_direction'], size=n)
+        turns = turns * self.random.choice('direction_sign', [-1, 1], size=n)
+        grades = self.s['change_grade'] + np.cumsum(turns)
 
-        if self.s['change_space_jump_every_step']:
-            self.s['space_jump'] = randint(1, self.s['max_space_jump']+1)
-
-        delta_grade = choice(self.s['s_change_direction'],
-                             p=self.s['p_change_direction'])
-        delta_grade *= choice([-1, 1])
-        self.s['change_grade'] = self.s['change_grade'] + delta_grade
+        # change_grade goes back to 0 every reset_every_frames steps, and goes on from there
+        steps = np.arange(self.planned_steps + 1, self.planned_steps + n + 1)
+        resets = np.where(steps % self.s['reset_every_frames'] == 0, np.arange(n), -1)
+        last_reset = np.maximum.accumulate(resets)
+        grades = grades - np.where(last_reset >= 0, grades[last_reset], 0)
+        self.s['change_grade'] = grades[-1].item()
 
-        if self.step % self.s['reset_every_frames'] == 0:
-            self.s['change_grade'] = 0
-
-        self.s['direction'] = (self.s['direction'] + (self.s['change_grade']/4))
-
-        self.origin[0] += delta[0] * self.s['space_jump']
-        self.origin[1] += delta[1] * self.s['space_jump']
-        return artifacts
+        # Each step moves in the direction before its grade is added
+        directions = np.cumsum(np.concatenate([[self.s['direction']], grades / 4]))
+        self.s['direction'] = directions[-1].item()
+        radians = np.radians(directions[:-1])
+        jumps = self.plan_space_jumps(n)
+        return np.stack([np.cos(radians) * jumps, np.sin(radians) * jumps], axis=1)
 
 
 class Explosion(Generator):
@@ -378,28 +587,68 @@ class Explosion(Generator):
         super().move_origin(new_x, new_y)
         self.reset()
 
-    def generate(self):
-        artifacts = []
-        artifact = self.new_step()
-        artifacts.append(artifact)
+    def plan_positions(self, n):
+        """
+        plan_positions
 
+        Origins after each of the next n steps, all at once, and the state after them
+        """
         if self.s['change_angle_jump_every_step']:
-            self.s['angle_jump'] = randint(self.s['min_angle_jump'], self.s['max_angle_jump']+1)
-
-        self.s['direction'] += (self.s['angle_jump']*self.s['angle_sign'])
-        delta = [
-            np.cos(np.radians(self.s['direction'])),
-            np.sin(np.radians(self.s['direction'])),
-        ]
-
-        self.s['distance'] += self.s['distance_jump']
-        self.origin[0] = self.center[0] + (delta[0] * self.s['distance'])
-        self.origin[1] = self.center[1] + (delta[1] * self.s['distance'])
+            jumps = self.random.integer('angle_jump', self.s['min_angle_jump'],
+                                        self.s['max_angle_jump']+1, size=n)
+            self.s['angle_jump'] = jumps[-1].item()
+        else:
+            jumps = np.full(n, self.s['angle_jump'])
+        directions = self.s['direction'] + np.cumsum(jumps * self.s['angle_sign'])
+        self.s['direction'] = directions[-1].item()
+        radians = np.radians(directions)
+        deltas = np.stack([np.cos(radians), np.sin(radians)], axis=1)
+
+        # The spiral starts again from where it is every reset_every_frames steps
+        steps = np.arange(self.step + 1, self.step + n + 1)
+        ends = np.flatnonzero(steps % self.s['reset_every_frames'] == 0) + 1
+        positions = np.empty((n, 2))
+        start = 0
+        for end in ends.tolist() + [n]:
+            if end == start:
+                continue
+            distances = self.s['distance'] + self.s['distance_jump'] * np.arange(1, end-start+1)
+            positions[start:end] = (np.asarray(self.center, float)
+                                    + deltas[start:end] * distances[:, None])
+            self.s['distance'] = distances[-1].item()
+            if steps[end - 1] % self.s['reset_every_frames'] == 0:
+                self.s['distance'] = self.s['initial_distance']
+                self.center = positions[end - 1].tolist()
+            start = end
+        self.origin[0], self.origin[1] = positions[-1].tolist()
+        return positions
 
-        if self.step % self.s['reset_every_frames'] == 0:
-            self.reset()
+    def generate(self):
+        if self.s['burst'] > 1:
+            origin = list(self.origin)
+            positions = self.plan_positions(self.get_burst())
+            return self.emit(np.vstack([[origin], positions[:-1]]))
+        return super().generate()
 
-        return artifacts
+    @classmethod
+    def move_group(cls, generators):
+        for generator in generators:
+            s = generator.s
+            if s['change_angle_jump_every_step']:
+                s['angle_jump'] = generator.random.integer('angle_jump', s['min_angle_jump'],
+                                                           s['max_angle_jump']+1)
+            s['direction'] += (s['angle_jump']*s['angle_sign'])
+            s['distance'] += s['distance_jump']
+
+        # The trigonometry of all of them at once
+        radians = np.radians([generator.s['direction'] for generator in generators])
+        deltas = zip(np.cos(radians).tolist(), np.sin(radians).tolist())
+        for generator, delta in zip(generators, deltas):
+            distance = generator.s['distance']
+            generator.origin[0] = generator.center[0] + (delta[0] * distance)
+            generator.origin[1] = generator.center[1] + (delta[1] * distance)
+            if generator.step % generator.s['reset_every_frames'] == 0:
+                generator.reset()
 
 
 class StainGrid(Generator):
@@ -420,10 +669,175 @@ class StainGrid(Generator):
         self.s['change_size_every_step'] = False
 
     def generate(self):
-        artifacts = []
-        artifacts.append(self.new_step())
-        direction = randint(0, 8)
-        delta = Generator.get_delta(direction)
-        self.origin[0] += delta[0] * self.s['space_jump']
-        self.origin[1] += delta[1] * self.s['space_jump']
-        return artifacts
+        if self.s['burst'] > 1:
+            moves = self.get_plan(self.get_burst())['move']
+            origins = np.cumsum(np.vstack([[self.origin], moves]), axis=0)
+            self.origin[0], self.origin[1] = origins[-1].tolist()
+            return self.emit(origins[:-1])
+        return super().generate()
+
+    def plan_moves(self, n):
+        directions = self.random.integer('direction', 0, 8, size=n)
+        return np.array(Generator.DELTAS)[directions] * self.s['space_jump']
+
+
+def expand_columns(columns):
+    """
+    expand_columns
+
+    Same artifact columns (see ArtifactStore.extend_columns) with an array for every
+    column, has_color and has_outline included
+    """
+    quantity = len(columns['origin'])
+    expanded = OrderedDict()
+    for name in ["kind", "origin", "sizes", "thickness", "lifespan"]:
+        expanded[name] = np.broadcast_to(columns[name], (quantity,) + np.shape(columns[name])[1:])
+    for name in ["color", "outline"]:
+        values = columns[name]
+        expanded[name] = np.zeros((quantity, 3), int) if values is None else values
+        has_name = "has_" + name
+        expanded[has_name] = np.broadcast_to(columns.get(has_name, values is not None), quantity)
+    return expanded
+
+
+class GeneratorBatch(object):
+    """
+    GeneratorBatch class.
+    Steps many generators at once. Instead of a shape object and an ArtifactStore.extend
+    per generator and frame, the planned steps of the next frames of all of them are
+    stacked in arrays (see plan_window) and every frame is a slice of those, added with
+    a single extend_columns. The generators are grouped by class to move them: the
+    planned moves are added to all the origins of a class at once, the rest use
+    Generator.move_group. The artifacts, and their order, are the same as calling
+    generate() on each generator.
+    """
+    def __init__(self, generators, window=64):
+        self.generators = generators
+        self.bursts = np.array([generator.s['burst'] for generator in generators])
+        self.single = np.flatnonzero(self.bursts == 1)
+        self.burst = np.flatnonzero(self.bursts > 1)
+
+        # Generators with one step per frame, and their positions in it by class
+        self.singles = [generators[index] for index in self.single]
+        self.groups = OrderedDict()
+        for position, generator in enumerate(self.singles):
+            self.groups.setdefault(generator.__class__, []).append(position)
+
+        # Columns that do not change from frame to frame
+        singles = self.singles
+        self.kind = np.array([g.SHAPE_KINDS[g.s['shape']] for g in singles], np.int8)
+        self.has_color = np.array([g.color is not None for g in singles], bool)
+        self.has_outline = np.array([g.outline is not None for g in singles], bool)
+        self.thickness = np.where(self.has_color, -1, [g.thickness for g in singles])
+        self.lifespan = np.array([g.s['lifespan'] for g in singles], int)
+
+        self.window = window
+        self.steps = None
+        self.window_used = window
+        # Generator class -> seconds planning the last window, see plan_window
+        self.plan_seconds = OrderedDict()
+
+    def plan_window(self):
+        """
+        plan_window
+
+        Stack the planned steps of the next window frames of every generator, in
+        (generator, frame, ...) arrays. The seconds spent planning the generators of
+        each class are kept in self.plan_seconds.
+        """
+        window = self.window
+        widths = OrderedDict([("shake", 2), ("paint", 3), ("sizes", 2), ("move", 2)])
+        steps = OrderedDict((name, []) for name in widths)
+        self.plan_seconds = OrderedDict((generator_class, 0.0) for generator_class in self.groups)
+        for generator, has_color in zip(self.singles, self.has_color):
+            started = perf_counter()
+            planned = generator.get_plan(window)
+            self.plan_seconds[generator.__class__] += perf_counter() - started
+            steps["shake"].append(planned["shake"])
+            # Only one of them is set, has_color and has_outline say which
+            steps["paint"].append(planned["color"] if has_color else planned["outline"])
+            steps["sizes"].append(planned["sizes"])
+            steps["move"].append(planned["move"] if "move" in planned else np.zeros((window, 2)))
+        self.steps = OrderedDict(
+            (name, np.stack(values) if values else np.zeros((0, window, widths[name])))
+            for name, values in steps.items()
+        )
+        sizes = self.steps["sizes"].reshape(-1, 2)
+        self.steps["sizes"] = get_shape_sizes(np.repeat(self.kind, window), sizes).reshape(
+            len(self.singles), window, 2
+        )
+        self.window_used = 0
+
+    def generate(self, profiler=None):
+        """
+        generate
+
+        Step every generator. Returns the columns of the new artifacts, see
+        ArtifactStore.extend_columns, and the index of the generator of each one.
+        """
+        plan_seconds = {}
+        if self.window_used == self.window:
+            self.plan_window()
+            plan_seconds = self.plan_seconds
+        step = self.window_used
+        self.window_used += 1
+
+        singles = self.singles
+        for generator in singles:
+            # Same as take_step, the rows are already in self.steps
+            generator.planned_used += 1
+            generator.step += 1
+        origins = np.array([generator.origin for generator in singles], float).reshape(-1, 2)
+        painted = origins + self.steps["shake"][:, step]
+
+        for generator_class, positions in self.groups.items():
+            started = perf_counter()
+            generators = [singles[position] for position in positions]
+            if generator_class.plan_moves is Generator.plan_moves:
+                generator_class.move_group(generators)
+            else:
+                moved = origins[positions] + self.steps["move"][positions, step]
+                for generator, (x, y) in zip(generators, moved.tolist()):
+                    generator.origin[0] = x
+                    generator.origin[1] = y
+            if profiler:
+                # Planning included, on the frames that plan the next window
+                seconds = perf_counter() - started + plan_seconds.get(generator_class, 0.0)
+                profiler.add_class("generator", generator_class.__name__, seconds)
+
+        paint = self.steps["paint"][:, step]
+        columns = OrderedDict([
+            ("kind", self.kind),
+            ("origin", painted.astype(np.int16)),
+            ("sizes", self.steps["sizes"][:, step]),
+            ("color", paint),
+            ("has_color", self.has_color),
+            ("outline", paint),
+            ("has_outline", self.has_outline),
+            ("thickness", self.thickness),
+            ("lifespan", self.lifespan),
+        ])
+        if not len(self.burst):
+            return columns, self.single
+
+        # Put the bursts between the rest, in the order of the generators. They get
+        # smaller once their quantity is used up, see Generator.get_burst
+        pieces = [expand_columns(columns)]
+        counts = np.ones(len(self.generators), int)
+        for index in self.burst:
+            started = perf_counter()
+            pieces.append(expand_columns(self.generators[index].generate()))
+            counts[index] = len(pieces[-1]["kind"])
+            if profiler:
+                profiler.add_class("generator", self.generators[index].__class__.__name__,
+                                   perf_counter() - started)
+        offsets = np.cumsum(counts) - counts
+        destination = np.concatenate([offsets[self.single]] + [
+            np.arange(offsets[index], offsets[index] + counts[index]) for index in self.burst
+        ])
+        merged = OrderedDict()
+        for name in pieces[0]:
+            values = np.concatenate([piece[name] for piece in pieces])
+            merged[name] = np.empty_like(values)
+            merged[name][destination] = values
+        return merged, np.repeat(np.arange(len(self.generators)), counts)
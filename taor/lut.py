@@ -0,0 +1,44 @@
+"""
+lut module.
+Contains LookupTable, the point operations (each output pixel depends only on
+the value of the same input pixel) used by the post effects.
+"""
+import cv2
+import numpy as np
+
+
+class LookupTable(object):
+    """
+    LookupTable class.
+    A 256 entry table per channel (B, G, R), applied with a single cv2.LUT pass
+    on uint8 data, instead of converting the frame to a wider type and masking it.
+    """
+    def __init__(self, table):
+        table = np.asarray(table, np.uint8)
+        if table.shape == (256,):
+            table = np.repeat(table[:, None], 3, axis=1)
+        if table.shape != (256, 3):
+            print("LookupTable error, table of shape %r not supported" % (table.shape,))
+            exit(1)
+        self.table = table.reshape(1, 256, 3).copy()
+
+    @classmethod
+    def palette(cls, colors):
+        """
+        palette
+
+        Identity table where the gray levels in the dict colors map to a BGR color
+        """
+        table = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+        for level, color in colors.items():
+            table[level] = color[:3]
+        return cls(table)
+
+    def colorize(self, gray, dst):
+        """
+        colorize
+
+        Map a single channel image through the tables into the BGR dst
+        """
+        cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst)
+        return cv2.LUT(dst, self.table, dst)
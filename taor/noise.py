@@ -0,0 +1,80 @@
+"""
+noise module.
+Contains NoiseSource, the generator of the frames of random color noise
+used by RandomNoiseChange.
+"""
+import cv2
+import numpy as np
+
+
+class NoiseSource(object):
+    """
+    NoiseSource class.
+    Fills a preallocated frame with uniform random bytes straight from a fast
+    bit generator (SFC64), seeded once, instead of asking the legacy global
+    RNG for a new array on every frame.
+
+    With bank_size > 0 only the first bank_size frames are generated. Those
+    planes are a bit bigger than the frame, and every later frame is a window
+    of one of them taken at a random offset and flipped at random, so it costs
+    a copy instead of RNG work.
+
+    The memory is allocated on the first next_frame, a change is created some
+    time before it starts.
+    """
+    def __init__(self, img_shape, seed, bank_size=0, bank_margin=64):
+        self.img_height, self.img_width = img_shape
+        self.rng = np.random.Generator(np.random.SFC64(seed))
+        self.bank_size = bank_size
+        self.bank_margin = bank_margin
+        self.bank = []
+        self.buffer = None
+
+    def get_frame(self):
+        size = self.img_height * self.img_width * 3
+        if self.buffer is None:
+            # Rounded up to whole 64 bit words, so random_raw can fill it
+            self.buffer = np.empty(-(-size // 8) * 8, np.uint8)
+        return self.buffer[:size].reshape(self.img_height, self.img_width, 3)
+
+    def fill_random(self, buffer):
+        words = buffer.view(np.uint64)
+        words[:] = self.rng.bit_generator.random_raw(len(words))
+
+    def new_plane(self):
+        """
+        new_plane
+
+        Random plane for the bank, bank_margin pixels bigger than the frame
+        """
+        height = self.img_height + self.bank_margin
+        width = self.img_width + self.bank_margin
+        size = height * width * 3
+        plane = np.empty(-(-size // 8) * 8, np.uint8)
+        self.fill_random(plane)
+        return plane[:size].reshape(height, width, 3)
+
+    def next_frame(self):
+        """
+        next_frame
+
+        Fill the frame with new noise and return it. The same memory is
+        returned every time.
+        """
+        frame = self.get_frame()
+        if not self.bank_size:
+            self.fill_random(self.buffer)
+        elif len(self.bank) < self.bank_size:
+            self.bank.append(self.new_plane())
+            frame[:] = self.bank[-1][:self.img_height, :self.img_width]
+        else:
+            plane = self.bank[self.rng.integers(len(self.bank))]
+            y, x = self.rng.integers(self.bank_margin + 1, size=2)
+            window = plane[y:y + self.img_height, x:x + self.img_width]
+            # None, vertical, horizontal or both
+            flip = self.rng.integers(4)
+            if flip == 0:
+                frame[:] = window
+            else:
+                cv2.flip(window, flip - 2, frame)
+        return frame
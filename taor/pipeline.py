@@ -0,0 +1,130 @@
+"""
+pipeline module.
+Runs the generation of a video as three stages joined by bounded queues:
+    - simulation and painting of the frames, in the calling thread
+    - post effects, in its own thread
+    - encoding, in its own thread
+OpenCV releases the GIL while filtering and encoding, so the stages overlap.
+Frames travel between the stages in buffers owned by the pipeline, a stage
+blocks when the next one is behind (back-pressure).
+"""
+import queue
+import threading
+
+import numpy as np
+
+
+class PipelineAborted(Exception):
+    """
+    Raised inside a stage when another stage of the pipeline failed
+    """
+
+
+def put(target_queue, item, failed):
+    while True:
+        try:
+            target_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if failed.is_set():
+                raise PipelineAborted()
+
+
+def get(source_queue, failed):
+    while True:
+        try:
+            return source_queue.get(timeout=0.1)
+        except queue.Empty:
+            if failed.is_set():
+                raise PipelineAborted()
+
+
+class PipelineStage(threading.Thread):
+    """
+    PipelineStage class.
+    Thread that takes tuples from input_queue, calls function with them and puts the
+    result in output_queue (if any). A None item marks the end of the frames.
+    """
+    def __init__(self, function, input_queue, output_queue, failed):
+        super().__init__(daemon=True)
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.failed = failed
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                item = get(self.input_queue, self.failed)
+                if item is None:
+                    break
+                result = self.function(*item)
+                if self.output_queue is not None:
+                    put(self.output_queue, result, self.failed)
+            if self.output_queue is not None:
+                put(self.output_queue, None, self.failed)
+        except PipelineAborted:
+            pass
+        except BaseException as error:
+            self.error = error
+            self.failed.set()
+
+
+def run_pipeline(step, apply_effects, write, total_frames, queue_size):
+    """
+    run_pipeline
+
+    Generate total_frames frames with step(frame_number) -> (frame, effects, changed),
+    process them with apply_effects(frame, effects, buffers, changed) and hand them to
+    write(frame), in order.
+    The output is the same as calling the three functions one after the other.
+    """
+    failed = threading.Event()
+    painted_queue = queue.Queue(queue_size)
+    encode_queue = queue.Queue(queue_size)
+    free_buffers = queue.Queue()
+
+    def effects_stage(buffers, effects, changed):
+        # The painted frame is a copy, the effects can use its memory once it is read
+        frame, other = buffers
+        return buffers, apply_effects(frame, effects, (other, frame), changed)
+
+    def encoder_stage(buffers, painted_frame):
+        write(painted_frame)
+        free_buffers.put(buffers)
+
+    stages = [
+        PipelineStage(effects_stage, painted_queue, encode_queue, failed),
+        PipelineStage(encoder_stage, encode_queue, None, failed),
+    ]
+    for stage in stages:
+        stage.start()
+
+    try:
+        buffers = 0
+        for frame_number in range(total_frames):
+            frame, effects, changed = step(frame_number)
+            # One pair of buffers per frame that can be in flight: one in each queue slot,
+            # one in each stage and the one being filled. The second buffer of the pair
+            # is only touched by the effects.
+            if free_buffers.empty() and buffers < 2 * queue_size + 3:
+                pair = np.empty_like(frame), np.empty_like(frame)
+                buffers += 1
+            else:
+                pair = get(free_buffers, failed)
+            np.copyto(pair[0], frame)
+            put(painted_queue, (pair, effects, changed), failed)
+        put(painted_queue, None, failed)
+    except PipelineAborted:
+        pass
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        for stage in stages:
+            stage.join()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
@@ -0,0 +1,110 @@
+"""
+pixel_map module.
+Contains PixelMap, the compiled form of the post effects that only move
+pixels around (mirrors).
+"""
+import cv2
+import numpy as np
+
+
+def map_interval(start, stop, dst_start, dst_stop, src_start, flip):
+    """
+    map_interval
+
+    Source interval of [start, stop), inside the destination interval
+    [dst_start, dst_stop) of a blit that copies from src_start on, flipped or not
+    """
+    if flip:
+        return src_start + dst_stop - stop, src_start + dst_stop - start
+    return src_start + start - dst_start, src_start + stop - dst_start
+
+
+def unmap_interval(start, stop, dst_start, dst_stop, src_start, flip):
+    """
+    unmap_interval
+
+    Inverse of map_interval: destination interval of the source interval [start, stop)
+    """
+    if flip:
+        return dst_stop - (stop - src_start), dst_stop - (start - src_start)
+    return dst_start + start - src_start, dst_start + stop - src_start
+
+
+class PixelMap(object):
+    """
+    PixelMap class.
+    Says where every pixel of the output comes from, as a list of blits that
+    cover the output exactly once. Each blit is a tuple
+    (x0, y0, x1, y1, u0, v0, flip_x, flip_y): the output rectangle x0:x1, y0:y1
+    is the input rectangle of the same size at u0, v0, flipped or not on each axis.
+
+    Applying a map is one copy or cv2.flip per blit, a single pass over the frame,
+    and a stack of maps is composed into one with then().
+    """
+    def __init__(self, img_shape, blits=None):
+        self.shape = img_shape
+        height, width = img_shape
+        if blits is None:
+            blits = [(0, 0, width, height, 0, 0, False, False)]
+        self.blits = [blit for blit in blits if blit[2] > blit[0] and blit[3] > blit[1]]
+
+    @classmethod
+    def flip_region(cls, img_shape, src, dst, flip_x, flip_y):
+        """
+        flip_region
+
+        Identity map except for the rectangle dst = (x0, y0, x1, y1), that takes
+        the rectangle src of the same size, flipped
+        """
+        height, width = img_shape
+        x0, y0, x1, y1 = dst
+        blits = [
+            # Above, below, left and right of dst
+            (0, 0, width, y0, 0, 0, False, False),
+            (0, y1, width, height, 0, y1, False, False),
+            (0, y0, x0, y1, 0, y0, False, False),
+            (x1, y0, width, y1, x1, y0, False, False),
+            (x0, y0, x1, y1, src[0], src[1], flip_x, flip_y),
+        ]
+        return cls(img_shape, blits)
+
+    def then(self, other):
+        """
+        then
+
+        Map of applying self and then other
+        """
+        blits = []
+        for x0, y0, x1, y1, u0, v0, flip_x, flip_y in other.blits:
+            # Source rectangle of the blit of other, in the output of self
+            u1, v1 = u0 + x1 - x0, v0 + y1 - y0
+            for ax0, ay0, ax1, ay1, au0, av0, a_flip_x, a_flip_y in self.blits:
+                ix0, iy0 = max(u0, ax0), max(v0, ay0)
+                ix1, iy1 = min(u1, ax1), min(v1, ay1)
+                if ix0 >= ix1 or iy0 >= iy1:
+                    continue
+                dx0, dx1 = unmap_interval(ix0, ix1, x0, x1, u0, flip_x)
+                dy0, dy1 = unmap_interval(iy0, iy1, y0, y1, v0, flip_y)
+                sx0, _ = map_interval(ix0, ix1, ax0, ax1, au0, a_flip_x)
+                sy0, _ = map_interval(iy0, iy1, ay0, ay1, av0, a_flip_y)
+                blits.append((dx0, dy0, dx1, dy1, sx0, sy0,
+                              flip_x != a_flip_x, flip_y != a_flip_y))
+        return PixelMap(self.shape, blits)
+
+    def apply(self, image, dst):
+        """
+        apply
+
+        Write in dst the pixels of image moved by the map. dst can not be image
+        """
+        for x0, y0, x1, y1, u0, v0, flip_x, flip_y in self.blits:
+            src = image[v0:v0 + y1 - y0, u0:u0 + x1 - x0]
+            if flip_x and flip_y:
+                cv2.flip(src, -1, dst[y0:y1, x0:x1])
+            elif flip_x:
+                cv2.flip(src, 1, dst[y0:y1, x0:x1])
+            elif flip_y:
+                cv2.flip(src, 0, dst[y0:y1, x0:x1])
+            else:
+                np.copyto(dst[y0:y1, x0:x1], src)
+        return dst
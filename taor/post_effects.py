@@ -2,6 +2,8 @@ import numpy as np
 import cv2
 from numpy.random import randint, choice
 from taor.color_factory import ColorFactory
+from taor.lut import LookupTable
+from taor.pixel_map import PixelMap
 
 
 class PostEffectFactory(object):
@@ -35,7 +37,11 @@ class PostEffectFactory(object):
             max_diff_brightness=100,
 
             s_contour_thickness=[3, 5, 7],
-            p_contour_thickness=[0.4, 0.3, 0.3]
+            p_contour_thickness=[0.4, 0.3, 0.3],
+
+            # Memory for the frames kept by a Boomerang, None for no limit. Above it the
+            # frames are kept at a lower resolution
+            boomerang_max_mb=None,
         )
         self.fps = fps
         # self.color_factory = ColorFactory()
@@ -84,7 +90,7 @@ class PostEffectFactory(object):
                                p=self.config["p_contour_thickness"])
             change = Contour(self.fps, self.shape, color, thickness)
         elif effect_type == "boom":
-            change = Boomerang(self.fps, self.shape)
+            change = Boomerang(self.fps, self.shape, self.config["boomerang_max_mb"])
         else:
             print("BG change type %r not supported yet" % effect_type)
             exit(1)
@@ -92,6 +98,22 @@ class PostEffectFactory(object):
 
 
 class PostEffect(object):
+    """
+    Abstract Class.
+    process_effect(image, dst) must not modify image. It writes the processed frame
+    into dst, that has the same shape, and returns it. Effects that can skip the
+    work may return another array instead (image itself or one of their own), as long
+    as they do not modify it later.
+    """
+    # True if the output depends on the pixels of previous frames, not only on the
+    # current one. Those effects can not be skipped with skip_step.
+    uses_past_frames = False
+    # True if the output depends only on the input frame, not on the frame number
+    # or anything else. Those effects keep their output, see next_step.
+    stateless = False
+    # Rows of input around a strip of output that are enough to compute it, for
+    # the effects that can be processed in strips by process_region. None for the rest.
+    halo = None
 
     def __init__(self, fps, img_shape):
         self.shape = img_shape
@@ -104,21 +126,126 @@ class PostEffect(object):
         max_frames = self.fps * 60
         self.frames = randint(min_frames, max_frames + 1)
         self.frame = 0
-
-    def next_step(self, frame):
+        # Last output of a stateless effect and the effects applied before it
+        self.output = None
+        self.output_upstream = None
+        # Effects fused with this one and their PixelMap, see apply_pixel_maps
+        self.fused = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['output'] = None
+        state['output_upstream'] = None
+        return state
+
+    def next_step(self, frame, dst=None, upstream=(), same_input=False, tiles=None):
+        """
+        next_step
+
+        Process frame, writing into dst if given. upstream is the tuple of effects
+        applied to frame before this one. With same_input=True, frame has the same
+        pixels as in the previous call, and stateless effects return the output they
+        kept if upstream did not change either. They only keep their own copy of the
+        output once the input stops changing, otherwise they write into dst.
+        With tiles (a taor.tiles.TileScheduler), effects with a halo are processed
+        in strips by its threads.
+        """
         if self.frame < self.frames:
-            img = frame.copy()
-            frame = self.process_effect(img)
+            if self.stateless and same_input:
+                if not self.is_same_upstream(upstream):
+                    # The next frames are probably the same too, keep the output for them
+                    if self.output is None:
+                        self.output = np.empty_like(frame)
+                    self.process(frame, self.output, tiles)
+                self.output_upstream = upstream
+                frame = self.output
+            else:
+                self.output_upstream = None
+                if dst is None:
+                    dst = np.empty_like(frame)
+                frame = self.process(frame, dst, tiles)
             self.frame += 1
         else:
             self.working = False
             self.finished = True
         return frame
 
+    def process(self, image, dst, tiles=None):
+        if tiles is not None and self.halo is not None:
+            return self.process_tiled(image, dst, tiles)
+        return self.process_effect(image, dst)
+
+    def process_tiled(self, image, dst, tiles):
+        """
+        process_tiled
+
+        Same as process_effect, with every strip of rows computed by process_region
+        in the threads of tiles
+        """
+        tiles.map(lambda y0, y1: self.process_region(image, dst, y0, y1), self.img_height)
+        return dst
+
+    def process_region(self, image, dst, y0, y1):
+        """
+        process_region
+
+        Write the rows y0:y1 of the output in dst, reading only the rows of image up
+        to halo rows away. It is called from several threads at the same time, it can
+        only write those rows of dst.
+        """
+        print("Not implemented %r" % self.__class__)
+
+    def get_halo_rows(self, y0, y1, halo):
+        return max(y0 - halo, 0), min(y1 + halo, self.img_height)
+
+    def get_pixel_map(self):
+        """
+        get_pixel_map
+
+        taor.pixel_map.PixelMap of the effects that only move pixels around, None for
+        the rest. Consecutive effects with a map are applied in one pass, see group_effects
+        """
+        return None
+
+    def is_processing(self):
+        """
+        is_processing
+
+        True if the next call to next_step will process the frame
+        """
+        return self.frame < self.frames
+
+    def is_same_upstream(self, upstream):
+        return (self.output_upstream is not None
+                and len(upstream) == len(self.output_upstream)
+                and all(a is b for a, b in zip(upstream, self.output_upstream)))
+
+    def skip_step(self):
+        """
+        skip_step
+
+        Advance the effect one frame, like next_step, but without processing any pixel
+        """
+        if self.frame < self.frames:
+            self.advance()
+            self.output_upstream = None
+            self.frame += 1
+        else:
+            self.working = False
+            self.finished = True
+
+    def advance(self):
+        """
+        advance
+
+        Update the state of the effect after processing a frame. Nothing for most of them
+        """
+        pass
+
     def get_frames(self):
         return self.frames
 
-    def process_effect(self):
+    def process_effect(self, image, dst):
         print("Not implemented %r" % self.__class__)
         return None
 
@@ -133,6 +260,42 @@ class PostEffect(object):
         return self.finished
 
 
+def group_effects(effects):
+    """
+    group_effects
+
+    Split the effects of a frame, in order, in groups of one effect or of consecutive
+    effects that will process the frame and have a PixelMap, which can be applied
+    in one pass with apply_pixel_maps
+    """
+    groups = []
+    for effect in effects:
+        fusable = effect.is_processing() and effect.get_pixel_map() is not None
+        if fusable and groups and groups[-1][0]:
+            groups[-1][1].append(effect)
+        else:
+            groups.append((fusable, [effect]))
+    return [group for _, group in groups]
+
+
+def apply_pixel_maps(effects, image, dst):
+    """
+    apply_pixel_maps
+
+    Process image with the effects of a group from group_effects in a single pass,
+    writing into dst, and advance them as next_step would do.
+    """
+    first = effects[0]
+    if first.fused is None or first.fused[0] != tuple(effects):
+        pixel_map = first.get_pixel_map()
+        for effect in effects[1:]:
+            pixel_map = pixel_map.then(effect.get_pixel_map())
+        first.fused = (tuple(effects), pixel_map)
+    for effect in effects:
+        effect.skip_step()
+    return first.fused[1].apply(image, dst)
+
+
 class Mirror(PostEffect):
     """mirror effect
 
@@ -151,20 +314,32 @@ class Mirror(PostEffect):
     Returns:
         image: Image
     """
+    stateless = True
+
     def __init__(self, fps, img_shape, axis_1, axis_2):
         super().__init__(fps, img_shape)
         self.axis_1 = axis_1
         self.axis_2 = axis_2
-
-    def process_effect(self, frame):
-        frame = self.process_axis(frame, self.axis_1)
-        frame = self.process_axis(frame, self.axis_2)
-        return frame
-
-    def process_axis(self, image, axis):
-        if not axis:
-            return image
-
+        self.pixel_map = None
+
+    def process_effect(self, image, dst):
+        return self.get_pixel_map().apply(image, dst)
+
+    def get_pixel_map(self):
+        if self.pixel_map is None:
+            pixel_map = PixelMap(self.shape)
+            for axis in (self.axis_1, self.axis_2):
+                if axis:
+                    pixel_map = pixel_map.then(self.get_axis_map(axis))
+            self.pixel_map = pixel_map
+        return self.pixel_map
+
+    def get_axis_map(self, axis):
+        """
+        get_axis_map
+
+        Map that pastes the flipped half of the image on the other half
+        """
         height, width = self.shape
         if axis == "h":
             box = (0, 0, int(height/2), width)
@@ -186,9 +361,9 @@ class Mirror(PostEffect):
             print("post_effects.mirror error, axis %s not supported" % axis)
             exit(0)
 
-        flipped = cv2.flip(image[box[0]:box[2], box[1]:box[3]], flip_method)
-        image[paste_point[0]:paste_point[2], paste_point[1]:paste_point[3]] = flipped
-        return image
+        paste = (paste_point[1], paste_point[0], paste_point[3], paste_point[2])
+        return PixelMap.flip_region(self.shape, (box[1], box[0]), paste,
+                                    flip_method == 1, flip_method == 0)
 
 
 class MirrorBox(PostEffect):
@@ -207,12 +382,20 @@ class MirrorBox(PostEffect):
     Returns:
         image: Image
     """
+    stateless = True
+
     def __init__(self, fps, img_shape, axis, box):
         super().__init__(fps, img_shape)
         self.axis = axis
         self.box = box
+        self.pixel_map = None
+
+    def process_effect(self, image, dst):
+        return self.get_pixel_map().apply(image, dst)
 
-    def process_effect(self, image):
+    def get_pixel_map(self):
+        if self.pixel_map is not None:
+            return self.pixel_map
         box = self.box
 
         if self.axis == "h":
@@ -223,70 +406,122 @@ class MirrorBox(PostEffect):
             print("post_effects.mirror_box error, axis %s not supported" % self.axis)
             exit(0)
 
-        flipped = cv2.flip(image[box[0]:box[2], box[1]:box[3]], flip_method)
-        image[box[0]:box[2], box[1]:box[3]] = flipped
-        return image
+        self.pixel_map = PixelMap.flip_region(self.shape, (box[1], box[0]),
+                                              (box[1], box[0], box[3], box[2]),
+                                              flip_method == 1, flip_method == 0)
+        return self.pixel_map
 
 
 class GrayScale(PostEffect):
     """
     Convert to grayscale
     """
-    def process_effect(self, image):
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+    stateless = True
+    # Each pixel only depends on itself
+    halo = 0
+
+    def __init__(self, fps, img_shape):
+        super().__init__(fps, img_shape)
+        self.gray = np.empty(img_shape, np.uint8)
+
+    def process_effect(self, image, dst):
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY, self.gray)
+        return cv2.cvtColor(self.gray, cv2.COLOR_GRAY2RGB, dst)
+
+    def process_region(self, image, dst, y0, y1):
+        gray = cv2.cvtColor(image[y0:y1], cv2.COLOR_RGB2GRAY)
+        cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB, dst[y0:y1])
 
 
 class BlackAndWhite(PostEffect):
     """
     Convert to binary
     """
-    def process_effect(self, image):
-        img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.adaptiveThreshold(img_gray, 255,
-                                       cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
-        return cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
+    stateless = True
+    # Half of the adaptive threshold block
+    halo = 5
+
+    def __init__(self, fps, img_shape):
+        super().__init__(fps, img_shape)
+        self.gray = np.empty(img_shape, np.uint8)
+        self.thresh = np.empty(img_shape, np.uint8)
+
+    def process_effect(self, image, dst):
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, self.gray)
+        cv2.adaptiveThreshold(self.gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY,
+                              11, 2, self.thresh)
+        return cv2.cvtColor(self.thresh, cv2.COLOR_GRAY2BGR, dst)
+
+    def process_region(self, image, dst, y0, y1):
+        a, b = self.get_halo_rows(y0, y1, self.halo)
+        gray = cv2.cvtColor(image[a:b], cv2.COLOR_BGR2GRAY)
+        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY, 11, 2)
+        cv2.cvtColor(thresh[y0 - a:y1 - a], cv2.COLOR_GRAY2BGR, dst[y0:y1])
 
 
 class ColorThreshold(PostEffect):
     """
     Convert to binary and paint with a color
     """
+    stateless = True
+    # Half of the adaptive threshold block
+    halo = 5
+
     def __init__(self, fps, img_shape, color):
         super().__init__(fps, img_shape)
         self.color = color
-
-    def process_effect(self, image):
-        img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        thresh = cv2.adaptiveThreshold(img_gray, 255,
-                                       cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
+        self.gray = np.empty(img_shape, np.uint8)
+        self.thresh = np.empty(img_shape, np.uint8)
+        # The black pixels of the threshold are painted with the color
+        self.lut = LookupTable.palette({0: color})
+
+    def process_effect(self, image, dst):
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, self.gray)
+        cv2.adaptiveThreshold(self.gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY,
+                              11, 2, self.thresh)
         # ones = np.count_nonzero(thresh)
         # zeros = thresh.size - ones
-        back2color = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-        back2color[np.where((back2color == [0, 0, 0]).all(axis=2))] = self.color
-        return back2color
+        return self.lut.colorize(self.thresh, dst)
+
+    def process_region(self, image, dst, y0, y1):
+        a, b = self.get_halo_rows(y0, y1, self.halo)
+        gray = cv2.cvtColor(image[a:b], cv2.COLOR_BGR2GRAY)
+        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY, 11, 2)
+        self.lut.colorize(thresh[y0 - a:y1 - a], dst[y0:y1])
 
 
 class GaussianBlur(PostEffect):
     """
     Gaussian Blur to ridiculous sizes
     """
+    stateless = True
+
     def __init__(self, fps, img_shape, gauss_size):
         super().__init__(fps, img_shape)
         self.gauss_size = gauss_size
+        self.halo = gauss_size // 2
 
     def __repr__(self):
         return "GaussianBlur for %d seconds and size %d" \
                % (round(self.frames/self.fps), self.gauss_size)
 
-    def process_effect(self, image):
-        return cv2.GaussianBlur(image, (self.gauss_size, self.gauss_size), 0)
+    def process_effect(self, image, dst):
+        return cv2.GaussianBlur(image, (self.gauss_size, self.gauss_size), 0, dst)
+
+    def process_region(self, image, dst, y0, y1):
+        a, b = self.get_halo_rows(y0, y1, self.halo)
+        blurred = cv2.GaussianBlur(image[a:b], (self.gauss_size, self.gauss_size), 0)
+        dst[y0:y1] = blurred[y0 - a:y1 - a]
 
 
 class Brightness(PostEffect):
     """
     Brightness change
     """
+    halo = 0
+
     def __init__(self, fps, img_shape, diff):
         super().__init__(fps, img_shape)
         self.diff = diff
@@ -300,71 +535,151 @@ class Brightness(PostEffect):
         return "Brightness for %d seconds and diff %d" \
                % (round(self.frames/self.fps), self.diff)
 
-    def process_effect(self, image):
-        pseudo_image = np.int32(image) + self.current
-        pseudo_image[pseudo_image > 255] = 255
-        pseudo_image[pseudo_image < 0] = 0
+    def process_effect(self, image, dst):
+        self.process_region(image, dst, 0, self.img_height)
+        self.advance()
+        return dst
+
+    def process_tiled(self, image, dst, tiles):
+        super().process_tiled(image, dst, tiles)
+        self.advance()
+        return dst
+
+    def process_region(self, image, dst, y0, y1):
+        # Saturated, the same as clipping the sum to 0..255
+        current = abs(self.current)
+        if self.current >= 0:
+            cv2.add(image[y0:y1], (current, current, current, 0), dst[y0:y1])
+        else:
+            cv2.subtract(image[y0:y1], (current, current, current, 0), dst[y0:y1])
 
+    def advance(self):
         if self.frame <= abs(self.diff):
             self.current += self.add
         elif self.frames - self.frame <= abs(self.diff):
             self.current -= self.add
-        return np.uint8(pseudo_image)
 
 
 class Contour(PostEffect):
     """
     Find and paint contours change
     """
+    stateless = True
+    # Radius of the bilateral filter (4), the threshold block (1) and the closing (2 + 2)
+    halo = 9
+
     def __init__(self, fps, img_shape, color, thickness):
         super().__init__(fps, img_shape)
         self.color = color
         self.thickness = thickness
+        self.kernel = np.ones((5, 5), np.uint8)
+        self.gray = np.empty(img_shape, np.uint8)
+        self.smooth = np.empty(img_shape, np.uint8)
+        self.thresh = np.empty(img_shape, np.uint8)
+        self.closed = np.empty(img_shape, np.uint8)
 
     def __repr__(self):
         return "Contour for %d seconds with thickness %d" \
                % (round(self.frames/self.fps), self.thickness)
 
-    def process_effect(self, image):
-        img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        img_gray = cv2.bilateralFilter(img_gray, 9, 75, 75)
-        thresh = cv2.adaptiveThreshold(
-            img_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 3, 2
+    def process_effect(self, image, dst):
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, self.gray)
+        cv2.bilateralFilter(self.gray, 9, 75, 75, self.smooth)
+        cv2.adaptiveThreshold(
+            self.smooth, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 3, 2,
+            self.thresh
         )
-        kernel = np.ones((5, 5), np.uint8)
         # thresh = cv2.dilate(thresh, kernel, iterations=1)
-        thresh = 255 - thresh  # superhack
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        im2, contours, hierarchy = cv2.findContours(thresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
-        # print(hierarchy)
-        cv2.drawContours(image, contours, -1, self.color, self.thickness)
+        cv2.bitwise_not(self.thresh, self.thresh)  # superhack
+        cv2.morphologyEx(self.thresh, cv2.MORPH_CLOSE, self.kernel, self.closed)
+        return self.draw_contours(image, dst)
+
+    def process_tiled(self, image, dst, tiles):
+        # Only finding the edges is local, the contours are found in the whole frame
+        tiles.map(lambda y0, y1: self.process_region(image, dst, y0, y1), self.img_height)
+        return self.draw_contours(image, dst)
+
+    def process_region(self, image, dst, y0, y1):
+        """
+        process_region
+
+        Only the rows y0:y1 of self.closed, the edges of the image
+        """
+        a, b = self.get_halo_rows(y0, y1, self.halo)
+        gray = cv2.cvtColor(image[a:b], cv2.COLOR_BGR2GRAY)
+        smooth = cv2.bilateralFilter(gray, 9, 75, 75)
+        thresh = cv2.adaptiveThreshold(
+            smooth, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 3, 2
+        )
+        cv2.bitwise_not(thresh, thresh)  # superhack
+        closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, self.kernel)
+        self.closed[y0:y1] = closed[y0 - a:y1 - a]
+
+    def draw_contours(self, image, dst):
+        # OpenCV 3 returns the image too, the contours are always the second to last
+        contours = cv2.findContours(self.closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)[-2]
+        np.copyto(dst, image)
+        cv2.drawContours(dst, contours, -1, self.color, self.thickness)
         # return cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-        return image
+        return dst
 
 
 class Boomerang(PostEffect):
     """
     Boomerang Effect
+    The frames are recorded in a ring of effect_length frames, allocated once and
+    reused on every cycle. With max_mb, if the ring would need more than max_mb
+    megabytes the frames are kept at the resolution that fits and scaled back
+    when played.
     """
-    def __init__(self, fps, img_shape):
+    uses_past_frames = True
+
+    def __init__(self, fps, img_shape, max_mb=None):
         super().__init__(fps, img_shape)
-        self.buffer = []
+        self.buffer = None
+        self.recorded = 0
         self.effect_length = randint(self.fps, self.fps*2)
         self.times = self.frames // (self.effect_length*2)
         self.increment = 1
         self.buffer_index = self.effect_length - 1
         self.reached_limit = 0
 
+        self.buffer_shape = img_shape
+        frame_bytes = self.img_height * self.img_width * 3
+        if max_mb is not None and self.effect_length * frame_bytes > max_mb * 2**20:
+            scale = (max_mb * 2**20 / (self.effect_length * frame_bytes)) ** 0.5
+            self.buffer_shape = (max(int(self.img_height * scale), 1),
+                                 max(int(self.img_width * scale), 1))
+
     def __repr__(self):
         return "Boomerang for %d seconds with effect length %d for %d times" \
                % (round(self.frames/self.fps), self.effect_length, self.times)
 
-    def process_effect(self, image):
-        if len(self.buffer) < self.effect_length:
-            self.buffer.append(image.copy())
+    def is_reduced(self):
+        return self.buffer_shape != self.shape
+
+    def store(self, index, image):
+        if self.buffer is None:
+            self.buffer = np.empty((self.effect_length,) + self.buffer_shape + (3,), np.uint8)
+        if self.is_reduced():
+            height, width = self.buffer_shape
+            cv2.resize(image, (width, height), self.buffer[index], interpolation=cv2.INTER_AREA)
+        else:
+            self.buffer[index] = image
+
+    def load(self, index, dst):
+        if self.is_reduced():
+            return cv2.resize(self.buffer[index], (self.img_width, self.img_height), dst,
+                              interpolation=cv2.INTER_LINEAR)
+        return self.buffer[index]
+
+    def process_effect(self, image, dst):
+        if self.recorded < self.effect_length:
+            self.store(self.recorded, image)
+            self.recorded += 1
         else:
             if self.reached_limit < 3:
-                ret_val = self.buffer[self.buffer_index]
+                ret_val = self.load(self.buffer_index, dst)
 
                 if self.buffer_index == 0:
                     self.increment = 1
@@ -375,7 +690,7 @@ class Boomerang(PostEffect):
                 self.buffer_index += self.increment
                 return ret_val
             else:
-                self.buffer = []
+                self.recorded = 0
                 self.reached_limit = 0
                 self.buffer_index = self.effect_length - 1
         return image
@@ -0,0 +1,113 @@
+"""
+profiler module.
+Contains Profiler, the per phase timing of random_video.
+"""
+import csv
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+PHASES = [
+    "generation",  # Phase 0
+    "background",  # Phase I
+    "painting",  # Phase II, painting and death
+    "effects",  # Phase III, post effects (the scheduling is in "scheduling")
+    "scheduling",  # Phase III, effects starting and finishing
+    "movement",  # Phase IV
+    "write",  # Phase V
+]
+PERCENTILES = [50, 90, 99]
+
+
+class Profiler(object):
+    """
+    Profiler class.
+    Collects the wall time of every phase of every frame, broken down by the class
+    of the generators, background changes and post effects, and the quantity of
+    artifacts of each frame (alive, painted and skipped off the canvas). The phases
+    can be timed from different threads.
+    """
+    def __init__(self):
+        self.phases = OrderedDict((phase, []) for phase in PHASES)
+        # (kind, class name) -> seconds, one entry per frame where it run
+        self.classes = OrderedDict()
+        self.counters = OrderedDict((name, []) for name in ["artifacts", "painted", "skipped"])
+        self.start = time.perf_counter()
+        self.total = None
+
+    def add(self, phase, seconds):
+        self.phases[phase].append(seconds)
+
+    def add_class(self, kind, name, seconds):
+        self.classes.setdefault((kind, name), []).append(seconds)
+
+    def timed(self, phase, function):
+        """
+        timed
+
+        Wrap function so every call is added to phase
+        """
+        def timed_function(*args, **kwargs):
+            started = time.perf_counter()
+            result = function(*args, **kwargs)
+            self.add(phase, time.perf_counter() - started)
+            return result
+        return timed_function
+
+    def count(self, name, value):
+        self.counters[name].append(value)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def get_summary(self):
+        """
+        get_summary
+
+        Rows (OrderedDict) with count, total, mean, percentiles and max of every
+        phase, class and counter
+        """
+        rows = []
+        for phase, values in self.phases.items():
+            rows.append(summarize("phase", phase, values))
+        for (kind, name), values in self.classes.items():
+            rows.append(summarize(kind, name, values))
+        for name, values in self.counters.items():
+            rows.append(summarize("count", name, values))
+        return rows
+
+    def save(self, file_name):
+        """
+        save
+
+        Write the summary to file_name, as CSV if it ends with .csv and JSON otherwise.
+        The JSON also has the artifact counts of every frame.
+        """
+        rows = self.get_summary()
+        if file_name.endswith(".csv"):
+            with open(file_name, "w", newline="") as output:
+                writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(file_name, "w") as output:
+                json.dump(OrderedDict([
+                    ("total_seconds", self.total),
+                    ("frames", len(self.phases["painting"])),
+                    ("summary", rows),
+                    ("per_frame", self.counters),
+                ]), output, indent=2)
+
+
+def summarize(kind, name, values):
+    values = np.asarray(values, float)
+    row = OrderedDict([("kind", kind), ("name", name), ("count", len(values))])
+    row["total"] = float(values.sum())
+    row["mean"] = float(values.mean()) if len(values) else 0.0
+    for percentile in PERCENTILES:
+        value = np.percentile(values, percentile) if len(values) else 0.0
+        row["p%d" % percentile] = float(value)
+    row["max"] = float(values.max()) if len(values) else 0.0
+    return row
@@ -0,0 +1,83 @@
+"""
+random_stream module.
+Contains RandomStream, the source of the random decisions a generator takes
+on every step.
+"""
+import zlib
+
+import numpy as np
+
+
+class RandomStream(object):
+    """
+    RandomStream class.
+    Own random streams (SFC64) of a generator. A scalar numpy.random.choice with
+    probabilities costs tens of microseconds, so the values of every decision
+    are sampled block_size at a time, with one vectorized call, and handed out
+    one by one, or many at once with size.
+
+    Every decision (name and parameters) has its own stream, seeded from seed
+    and the decision, so the values it gets do not depend on the order the
+    decisions are taken in. That is what allows planning many steps ahead,
+    see Generator.plan. Changing the parameters of a decision starts a new
+    stream.
+    """
+    def __init__(self, seed, block_size=4096):
+        self.seed = seed
+        self.block_size = block_size
+        # decision key -> [values, index of the next one, numpy Generator]
+        self.blocks = {}
+
+    def get_block(self, key, sample):
+        block = self.blocks.get(key)
+        if block is None:
+            # crc32 instead of hash, that changes between runs
+            entropy = [self.seed, zlib.crc32(repr(key).encode())]
+            rng = np.random.Generator(np.random.SFC64(np.random.SeedSequence(entropy)))
+            block = self.blocks[key] = [None, self.block_size, rng]
+        if block[1] == self.block_size:
+            block[0] = sample(block[2], self.block_size)
+            block[1] = 0
+        return block
+
+    def take(self, key, sample, size=None):
+        """
+        take
+
+        Next value of the decision key, or an array with the next size values.
+        sample(rng, n) returns n new values from rng.
+        """
+        if size is None:
+            block = self.get_block(key, sample)
+            block[1] += 1
+            return block[0][block[1] - 1].item()
+        chunks = []
+        while size > 0:
+            block = self.get_block(key, sample)
+            chunk = block[0][block[1]:block[1] + size]
+            block[1] += len(chunk)
+            size -= len(chunk)
+            chunks.append(chunk)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks or [np.zeros(0, int)])
+
+    def integer(self, name, low, high, size=None):
+        """
+        integer
+
+        Random integer in [low, high), like numpy.random.randint
+        """
+        return self.take(("integer", name, low, high),
+                         lambda rng, n: rng.integers(low, high, n), size)
+
+    def choice(self, name, options, p=None, size=None):
+        """
+        choice
+
+        Random element of options, with probabilities p, like numpy.random.choice
+        """
+        key = ("choice", name, tuple(options), None if p is None else tuple(p))
+        return self.take(key, lambda rng, n: np.asarray(options)[
+            rng.choice(len(options), n, p=p)
+        ], size)
@@ -2,13 +2,24 @@
 randomvideo module.
 """
 import datetime
+from collections import OrderedDict
+from functools import partial
+from time import perf_counter
 import numpy as np
 from numpy.random import choice, randint
 from cv2 import VideoWriter, VideoWriter_fourcc
 
-from taor.generators import GeneratorFactory
+from taor.artifacts import ArtifactStore, get_extents, inside_canvas
+from taor.background import Background
+from taor.pipeline import run_pipeline
+from taor.segments import render_segments
+from taor.generators import GeneratorFactory, GeneratorBatch
 from taor.color_factory import ColorFactory
 from taor.schedulers import BackgroundChangeScheduler, EffectScheduler
+from taor.post_effects import group_effects, apply_pixel_maps
+from taor.profiler import Profiler
+from taor.tiles import TileScheduler
+from taor.sprites import SpriteCache
 
 config = dict(
     FPS=24,  # Frames Per Seconds
@@ -20,6 +31,16 @@ config = dict(
     min_effect_wait=30,  # Minimum seconds for an effect to work
     max_effect_wait=60,  # Maximum seconds for an effect to work
     p_movement=[0.75, 0.12, 0.13],  # Probability of 0, 1 and -1 movement
+    damage_tracking=True,  # Repaint only the regions of dead artifacts instead of everything
+    max_damage_ratio=0.25,  # Fraction of the frame above which a full redraw is cheaper
+    damage_halo=16,  # Extra pixels drawn around a damaged region, discarded afterwards
+    translate_on_movement=True,  # Shift the last frame on global movement instead of redrawing
+    pipeline_queue_size=4,  # Frames waiting between the stages of the pipelined mode
+    effect_threads=1,  # Threads that process the post effects in strips, 1 for no threads
+    paint_threads=1,  # Threads that paint the artifacts in strips on full redraws
+    burst_frames=None,  # Frames Explosion and StainGrid take to emit all their artifacts
+    skip_off_canvas=True,  # Do not store the artifacts that can never be inside the canvas
+    sprite_cache_mb=0,  # Memory for the masks of thick outlines, 0 to paint them with OpenCV
 )
 
 
@@ -42,6 +63,82 @@ def get_movement(p_movement):
     return movement_y, movement_x
 
 
+def clip_bounds(bounds, img_width, img_height):
+    """
+    clip_bounds
+
+    Clip an array of (x0, y0, x1, y1) bounds to the frame and drop the empty ones
+    """
+    bounds = bounds.copy()
+    bounds[:, 0::2] = np.clip(bounds[:, 0::2], 0, img_width)
+    bounds[:, 1::2] = np.clip(bounds[:, 1::2], 0, img_height)
+    return bounds[(bounds[:, 0] < bounds[:, 2]) & (bounds[:, 1] < bounds[:, 3])]
+
+
+def shift_frame(frame, shift_x, shift_y):
+    """
+    shift_frame
+
+    Translate the content of frame in place by an integer offset. The border that
+    gets uncovered keeps its old pixels, see get_uncovered_bounds.
+    """
+    height, width = frame.shape[:2]
+    src_y = slice(max(-shift_y, 0), height - max(shift_y, 0))
+    dst_y = slice(max(shift_y, 0), height - max(-shift_y, 0))
+    src_x = slice(max(-shift_x, 0), width - max(shift_x, 0))
+    dst_x = slice(max(shift_x, 0), width - max(-shift_x, 0))
+    frame[dst_y, dst_x] = frame[src_y, src_x]
+
+
+def may_paint(columns, canvas_size, movement_x, movement_y, move_every_n_frames):
+    """
+    may_paint
+
+    Which of the new artifacts in columns (see ArtifactStore.extend_columns, with an
+    array for every column) can be inside the canvas at some point of their life.
+    The global movement moves them at most once every move_every_n_frames frames,
+    starting this frame, so their extents are stretched in its direction.
+    """
+    extents = get_extents(columns['kind'], columns['origin'], columns['sizes'])
+    moves = columns['lifespan'] // move_every_n_frames + 1
+    for axis, movement in enumerate([movement_x, movement_y]):
+        if movement:
+            drift = moves * movement
+            extents[:, axis] += np.minimum(drift, 0)
+            extents[:, axis + 2] += np.maximum(drift, 0)
+    return inside_canvas(extents, canvas_size)
+
+
+def get_uncovered_bounds(shift_x, shift_y, img_width, img_height):
+    """
+    get_uncovered_bounds
+
+    Bounds (x0, y0, x1, y1) of the border that gets uncovered by shift_frame
+    """
+    bounds = []
+    if shift_x > 0:
+        bounds.append((0, 0, shift_x, img_height))
+    elif shift_x < 0:
+        bounds.append((img_width + shift_x, 0, img_width, img_height))
+    if shift_y > 0:
+        bounds.append((0, 0, img_width, shift_y))
+    elif shift_y < 0:
+        bounds.append((0, img_height + shift_y, img_width, img_height))
+    return np.array(bounds, dtype=int).reshape(-1, 4)
+
+
+def crosses_edges(bounds, img_width, img_height):
+    """
+    crosses_edges
+
+    Which bounds (see ArtifactStore.get_bounds) go past an edge of the frame. OpenCV
+    clips those shapes, and clipping moves their anti-aliased pixels, so after
+    shift_frame they are not the same as painted again where they are.
+    """
+    x0, y0, x1, y1 = bounds.T
+    return (x0 < 0) | (y0 < 0) | (x1 > img_width) | (y1 > img_height)
+
+
 def print_to_timeline(fps, frame_number, message):
     print("%s : %s " % (
         str(datetime.timedelta(seconds=int(frame_number/fps))),
@@ -50,207 +147,499 @@ def print_to_timeline(fps, frame_number, message):
     )
 
 
-def random_video(file_name=None, debug=False, seed=None, total_frames=None, generators_quantity=1):
-    if seed:
-        np.random.seed(seed)
+class RandomVideo(object):
+    """
+    RandomVideo class.
+    Holds the state of a video being generated: generators, schedulers, background,
+    artifacts and the last frame.
+
+    step() runs the simulation and painting of one frame (Phases 0, I, II and IV) and
+    decides which post effects are active on it. Applying those effects (Phase III) and
+    writing the frame (Phase V) is left to the caller, see apply_effects, so they can
+    run in other threads.
+    """
+    def __init__(self, file_name=None, debug=False, seed=None, total_frames=None,
+                 generators_quantity=1):
+        self.debug = debug
+        self.img_width = config['img_width']
+        self.img_height = config['img_height']
+        self.FPS = FPS = config['FPS']
+
+        print("Creating Video")
+        print("  - file_name: %s" % file_name)
+        print("  - img_width: %d" % self.img_width)
+        print("  - img_height: %s" % self.img_height)
+        print("  - total_frames: %d" % total_frames)
+        print("  - seed: %r" % seed)
+        print("  - generators_quantity: %d" % generators_quantity)
+
+        # Create all the Factories
+        generator_factory = GeneratorFactory(max(self.img_height, self.img_width))
+        generator_factory.config['burst_frames'] = config['burst_frames']
+        self.bg_change_scheduler = BackgroundChangeScheduler(
+            FPS, config['min_bg_change_wait'], config['max_bg_change_wait'],
+            self.img_height, self.img_width
+        )
+        self.effect_scheduler = EffectScheduler(
+            FPS, config['min_effect_wait'], config['max_effect_wait'],
+            self.img_height, self.img_width
+        )
 
-    img_width = config['img_width']
-    img_height = config['img_height']
-    FPS = config['FPS']
-
-    print("Creating Video")
-    print("  - file_name: %s" % file_name)
-    print("  - img_width: %d" % img_width)
-    print("  - img_height: %s" % img_height)
-    print("  - total_frames: %d" % total_frames)
-    print("  - seed: %r" % seed)
-    print("  - generators_quantity: %d" % generators_quantity)
-
-    # Create all the Factories
-    generator_factory = GeneratorFactory(max(img_height, img_width))
-    bg_change_scheduler = BackgroundChangeScheduler(
-        FPS, config['min_bg_change_wait'], config['max_bg_change_wait'], img_height, img_width
-    )
-    effect_scheduler = EffectScheduler(
-        FPS, config['min_effect_wait'], config['max_effect_wait'], img_height, img_width
-    )
+        # Initialize the Canvas and set it to an initial random color
+        canvas, self.current_color = get_canvas(self.img_height, self.img_width)
 
-    # Initialize the Canvas and set it to an initial random color
-    canvas, current_color = get_canvas(img_height, img_width)
-    video = get_video(file_name, FPS, img_width, img_height)
+        # Global movement of artifacts
+        self.movement_y, self.movement_x = get_movement(config['p_movement'])
+        self.move_every_n_frames = randint(1, FPS+1)
 
-    # Global movement of artifacts
-    movement_y, movement_x = get_movement(config['p_movement'])
-    move_every_n_frames = randint(1, FPS+1)
+        # Maximum number of repeated frames before relocating the generator's center.
+        # With many generators, each one counts its frames without a visible artifact
+        self.max_repeated_frames = randint(FPS*1, FPS*4+1)
 
-    # Maximum number of repeated frames before relocating the generator's center
-    max_repeated_frames = randint(FPS*1, FPS*4+1)
+        self.generators = []
+        for _ in range(generators_quantity):
+            self.generators.append(generator_factory.create_generator())
+        self.generator_batch = GeneratorBatch(self.generators)
+        self.idle_frames = np.zeros(len(self.generators), int)
 
-    generators = []
-    for _ in range(generators_quantity):
-        generators.append(generator_factory.create_generator())
+        print("Created the following Generator(s):")
+        for g in self.generators:
+            print(type(g))
+            if debug:
+                print(g)
 
-    print("Created the following Generator(s):")
-    for g in generators:
-        print(type(g))
         if debug:
-            print(g)
-
-    if debug:
-        print("max_repeated_frames = %d" % max_repeated_frames)
-        print("Global Movement")
-        print("  movement_x = %r" % movement_x)
-        print("  movement_y = %r" % movement_y)
-        print("  move_every_n_frames = %d" % move_every_n_frames)
-
-    last_frame = canvas.copy()
-
-    background_change = bg_change_scheduler.next_change(current_color)
-
-    effects = []
-    for _ in range(config['max_effects']):
-        effects.append(effect_scheduler.next_effect(current_frame=0))
-    effects.sort()
-
-    should_redraw = True
-    background = canvas.copy()
-    change_happening = None
-
-    effects_happening = []
-    artifacts = []
-
-    recycled_frames = 0
-    repeated_consecutive_frames = 0
-    ####################################################################################
-    ####################################################################################
-    # Start the show \(._.)/
-    ####################################################################################
-    ####################################################################################
-    print("=== Timeline ===")
-    print_to_timeline(FPS, 0, "Start Video")
-
-    for frame_number in range(total_frames):
+            print("max_repeated_frames = %d" % self.max_repeated_frames)
+            print("Global Movement")
+            print("  movement_x = %r" % self.movement_x)
+            print("  movement_y = %r" % self.movement_y)
+            print("  move_every_n_frames = %d" % self.move_every_n_frames)
+
+        self.last_frame = canvas
+
+        self.background_change = self.bg_change_scheduler.next_change(self.current_color)
+
+        self.effects = []
+        for _ in range(config['max_effects']):
+            self.effects.append(self.effect_scheduler.next_effect(current_frame=0))
+        self.effects.sort()
+
+        self.should_redraw = True
+        self.background = Background((self.img_height, self.img_width), self.current_color)
+        self.change_happening = None
+
+        self.effects_happening = []
+        sprites = None
+        if config['sprite_cache_mb']:
+            sprites = SpriteCache(config['sprite_cache_mb'] * 2**20)
+        self.artifacts = ArtifactStore(sprites=sprites)
+        self.damaged = np.zeros((0, 4), int)
+        self.shift = None
+        self.entered = []
+
+        self.recycled_frames = 0
+        self.repeated_consecutive_frames = 0
+        # taor.profiler.Profiler to time the phases, if any
+        self.profiler = None
+        # taor.tiles.TileScheduler that paints the full redraws in strips, if any
+        self.paint_tiles = None
+
+    def step(self, frame_number, paint=True):
+        """
+        step
+
+        Generate frame number frame_number. Returns the painted frame, the list
+        of post effects that should be applied to it, in order, and False if the frame
+        is known to have the same pixels as the one returned by the previous call.
+        The frame is reused by the next call, it must not be modified.
+
+        With paint=False only the simulation runs: the state evolves exactly the same,
+        consuming the same random numbers, but no artifact is painted and the returned
+        frame is None. The next painted step after that has to redraw, see resume.
+        """
+        FPS = self.FPS
+        img_width, img_height = self.img_width, self.img_height
+        canvas_size = (img_width, img_height)
+        artifacts = self.artifacts
         last_index = len(artifacts)
+        profiler = self.profiler
+        phase_start = perf_counter()
 
         # Phase 0: Get the artifact to print on this frame
-        for g in generators:
-            artifacts.extend(g.generate())
+        columns, owners = self.generator_batch.generate(profiler)
+        if config['skip_off_canvas']:
+            # The generators still take their steps, only the artifacts are dropped
+            keep = may_paint(columns, canvas_size, self.movement_x, self.movement_y,
+                             self.move_every_n_frames)
+            if profiler:
+                profiler.count("skipped", len(keep) - np.count_nonzero(keep))
+            if not keep.all():
+                columns = OrderedDict((name, values[keep]) for name, values in columns.items())
+                owners = owners[keep]
+        artifacts.extend(columns)
+        if len(self.generators) > 1:
+            visible = artifacts.will_paint(canvas_size, np.arange(last_index, len(artifacts)))
+            painting = np.bincount(owners, visible, len(self.generators)) > 0
+            self.idle_frames = np.where(painting, 0, self.idle_frames + 1)
+        if profiler:
+            phase_start = profile_phase(profiler, "generation", phase_start)
 
         ############################
         # Phase I: Background change
         ############################
-        if frame_number == background_change.time:
-            change_happening = background_change.bg_change
-            print_to_timeline(FPS, frame_number, background_change.bg_change)
+        if frame_number == self.background_change.time:
+            self.change_happening = self.background_change.bg_change
+            print_to_timeline(FPS, frame_number, self.background_change.bg_change)
 
+        change_happening = self.change_happening
         if change_happening and change_happening.is_working():
-            background = change_happening.next_step(background)
-            should_redraw = True
+            started = perf_counter()
+            self.background = change_happening.next_step(self.background)
+            if profiler:
+                profiler.add_class("background", change_happening.__class__.__name__,
+                                   perf_counter() - started)
+            self.should_redraw = True
             if change_happening.has_finished():
-                current_color = change_happening.get_final_color()
-                background_change = bg_change_scheduler.next_change(current_color)
+                self.current_color = change_happening.get_final_color()
+                self.background_change = self.bg_change_scheduler.next_change(
+                    self.current_color
+                )
                 print_to_timeline(FPS, frame_number, "Finished BG Change")
-                change_happening = None
+                self.change_happening = None
+        if profiler:
+            phase_start = profile_phase(profiler, "background", phase_start)
         # END OF Phase I
 
         ###################################################
         # Phase II: Deal with artifacts. Painting and Death
         ###################################################
-        if should_redraw:
-            frame = background.copy()
+        frame_changed = True
+        if not paint:
+            frame = None
+            initial_artifact = 0 if self.should_redraw else last_index
+        elif self.should_redraw:
+            # The last frame is not needed anymore, reuse its memory
+            frame = self.last_frame
+            if frame is None:
+                frame = self.background.new_frame()
+            elif not self.paint_tiles:
+                # Filled strip by strip by ArtifactStore.redraw otherwise
+                self.background.fill(frame)
             initial_artifact = 0
         else:
-            frame = last_frame
+            frame = self.last_frame
             initial_artifact = last_index
-            recycled_frames += 1
+            self.recycled_frames += 1
+            frame_changed = bool(self.shift) or len(self.damaged) > 0
+            if self.shift:
+                shift_frame(frame, *self.shift)
+            # Uncover only the regions left by the artifacts that died or moved
+            for bounds in self.damaged:
+                artifacts.repair(frame, self.background, bounds, config['damage_halo'],
+                                 stop=last_index)
 
         at_least_one_change = False
-        should_redraw = False
+        redraw = paint and self.should_redraw and self.paint_tiles is not None
+        self.should_redraw = False
+        self.damaged = np.zeros((0, 4), int)
+        self.shift = None
+
+        # Artifacts that entered the canvas with the last movement, already painted by repair
+        if not artifacts.painted[self.entered].all():
+            at_least_one_change = True
+        artifacts.painted[self.entered] = True
+        self.entered = []
 
         # Paint only the live artifacts that are inside the frame's boundaries
-        for a in artifacts[initial_artifact:]:
-            if not a.dead and a.will_paint((img_width, img_height)):
-                if not a.painted:
-                    at_least_one_change = True
-                a.draw(frame)
-                a.painted = True
+        rows = artifacts.visible_rows(canvas_size, start=initial_artifact)
+        if not artifacts.painted[rows].all():
+            at_least_one_change = True
+        if redraw:
+            artifacts.redraw(frame, self.background, rows, self.paint_tiles)
+        elif paint:
+            artifacts.draw(frame, rows)
+        if paint and len(rows) > 0:
+            frame_changed = True
+        if profiler:
+            profiler.count("painted", len(rows))
+        artifacts.painted[rows] = True
 
         # Check for dead artifacts. The ones that reached their lifespan.
         # If found, we know we should redraw the next frame, as something has changed
-        for a in artifacts:
-            if not a.dead:
-                a.age += 1
-                if a.age >= a.lifespan:
-                    a.dead = True
-                    if a.painted and a.will_paint((img_width, img_height)):
-                        at_least_one_change = True
-                        should_redraw = True
-        artifacts = [a for a in artifacts if not a.dead]
+        dying = artifacts.grow_old()
+        dying = dying[artifacts.painted[dying]]
+        dying = dying[artifacts.will_paint(canvas_size, dying)]
+        if len(dying) > 0:
+            at_least_one_change = True
+            if config['damage_tracking']:
+                self.damaged = clip_bounds(artifacts.get_bounds(dying), img_width, img_height)
+            else:
+                self.should_redraw = True
+        artifacts.compact()
 
         if not at_least_one_change:
-            repeated_consecutive_frames += 1
+            self.repeated_consecutive_frames += 1
         else:
-            repeated_consecutive_frames = 0
+            self.repeated_consecutive_frames = 0
+        if profiler:
+            profiler.count("artifacts", len(artifacts))
+            phase_start = profile_phase(profiler, "painting", phase_start)
         # END OF Phase II
 
         ##########################
         # Phase III: Post Effects
+        # Only the scheduling, the effects are applied by apply_effects
         ##########################
-        painted_frame = frame
+        effects = self.effects
 
         # Check if there is an effect starting this frame
         while len(effects) > 0 and effects[0].get_initial_frame() == frame_number:
-            effects_happening.append(effects.pop(0))
+            self.effects_happening.append(effects.pop(0))
             print_to_timeline(
-                FPS, frame_number, "Effect Started: %r" % effects_happening[-1].effect
+                FPS, frame_number, "Effect Started: %r" % self.effects_happening[-1].effect
             )
 
-        if len(effects_happening) > 0:
-            painted_frame = frame.copy()
-
+        frame_effects = []
         effects_to_remove = []
-        for index, happening in enumerate(effects_happening):
-            # Get the frame after processing the effect
-            painted_frame = happening.effect.next_step(painted_frame)
-            # should_redraw = True
-            if happening.effect.has_finished():
+        for index, happening in enumerate(self.effects_happening):
+            frame_effects.append(happening.effect)
+            # The effect finishes the frame after it processed all its frames
+            if frame_number == happening.get_final_frame():
                 print_to_timeline(FPS, frame_number, "Effect finished: %r" % happening.effect)
-                effects.append(effect_scheduler.next_effect(current_frame=frame_number))
+                effects.append(self.effect_scheduler.next_effect(current_frame=frame_number))
                 effects_to_remove.append(index)
 
-        effects_happening = [
-            effect for effect_number, effect in enumerate(effects_happening)
+        self.effects_happening = [
+            effect for effect_number, effect in enumerate(self.effects_happening)
             if effect_number not in effects_to_remove
         ]
         effects.sort()
+        if profiler:
+            phase_start = profile_phase(profiler, "scheduling", phase_start)
         # END OF Phase III
 
         #########################################
         # Phase IV: General Movement of Artifacts
         # TODO: Create artifact move effects
         #########################################
-        if (movement_x or movement_y) and frame_number % move_every_n_frames == 0:
-            for a in artifacts:
-                a.move_yx(movement_x, movement_y)
-            # of course we need to redraw
-            should_redraw = True
+        movement_x, movement_y = self.movement_x, self.movement_y
+        if (movement_x or movement_y) and frame_number % self.move_every_n_frames == 0:
+            # While the background is a plain color, moving every artifact is the same as
+            # shifting the whole frame. Then only the uncovered border and the artifacts
+            # that entered or left the canvas need to be painted again.
+            translate = (config['translate_on_movement'] and config['damage_tracking']
+                         and self.background.is_solid() and not self.should_redraw)
+            if translate:
+                rows = np.arange(len(artifacts))
+                visible_before = artifacts.will_paint(canvas_size, rows)
+                clipped_before = visible_before & crosses_edges(
+                    artifacts.get_bounds(rows), img_width, img_height)
+            artifacts.move_yx(movement_x, movement_y)
+            if translate:
+                self.shift = (movement_x or 0, movement_y or 0)
+                visible = artifacts.will_paint(canvas_size, rows)
+                crossed = np.flatnonzero(visible_before != visible)
+                self.entered = crossed[~visible_before[crossed]]
+                # The shapes that entered, left, or were or are clipped by the frame
+                bounds = artifacts.get_bounds(rows)
+                repaint = ((visible_before != visible) | clipped_before |
+                           (visible & crosses_edges(bounds, img_width, img_height)))
+                damaged = np.vstack([
+                    self.damaged + (self.shift * 2),
+                    bounds[repaint],
+                    get_uncovered_bounds(self.shift[0], self.shift[1], img_width, img_height),
+                ])
+                self.damaged = clip_bounds(damaged, img_width, img_height)
+            else:
+                # of course we need to redraw
+                self.should_redraw = True
 
         # Shake things up if there are too many repeated frames
-        if repeated_consecutive_frames > max_repeated_frames:
-            dx = randint(0, img_width)
-            dy = randint(0, img_height)
-            generators[0].move_origin(dx, dy)
-            repeated_consecutive_frames = 0
+        if len(self.generators) == 1:
+            if self.repeated_consecutive_frames > self.max_repeated_frames:
+                dx = randint(0, img_width)
+                dy = randint(0, img_height)
+                self.generators[0].move_origin(dx, dy)
+                self.repeated_consecutive_frames = 0
+        else:
+            # Every generator that has been painting out of the canvas for too long
+            for index in np.flatnonzero(self.idle_frames > self.max_repeated_frames):
+                dx = randint(0, img_width)
+                dy = randint(0, img_height)
+                self.generators[index].move_origin(dx, dy)
+                self.idle_frames[index] = 0
+
+        # Too many damaged pixels, it is cheaper to redraw the whole frame
+        damaged_area = np.prod(self.damaged[:, 2:] - self.damaged[:, :2], axis=1).sum()
+        if damaged_area > config['max_damage_ratio'] * img_width * img_height:
+            self.should_redraw = True
+        if profiler:
+            profile_phase(profiler, "movement", phase_start)
         # END OF Phase IV
 
-        ########################################
-        # Phase V: Actually Write Frame to Video
-        ########################################
-        video.write(painted_frame)
-        last_frame = frame
+        self.last_frame = frame
+        return frame, frame_effects, frame_changed
+
+    def resume(self):
+        """
+        resume
+
+        Prepare the state to paint again after steps with paint=False, or after
+        being unpickled without its last frame: the next frame is fully redrawn,
+        which gives the same pixels as the incremental painting.
+        """
+        self.should_redraw = True
+
+    def __getstate__(self):
+        # The last frame can always be redrawn, see resume
+        state = self.__dict__.copy()
+        state['last_frame'] = None
+        state['paint_tiles'] = None
+        return state
+
+
+def profile_phase(profiler, phase, phase_start):
+    """
+    profile_phase
+
+    Add to profiler the time since phase_start, returns the start of the next phase
+    """
+    now = perf_counter()
+    profiler.add(phase, now - phase_start)
+    return now
+
+
+def get_effect_buffers(frame):
+    return np.empty_like(frame), np.empty_like(frame)
+
+
+def apply_effects(frame, effects, buffers=None, changed=True, profiler=None, tiles=None):
+    """
+    apply_effects
+
+    Phase III: Apply the post effects returned by RandomVideo.step, in order.
+    frame is not modified. Each effect reads the output of the previous one and writes
+    into the other buffer of the pair buffers (see get_effect_buffers), so no frame is
+    allocated. The result is frame itself or one of the buffers, that belong to the caller
+    and can be reused once the result is written.
+    With changed=False (frame is the same as in the previous call) the stateless effects
+    whose input did not change either return their previous output.
+    Each effect is timed with profiler, if given.
+    With tiles (a taor.tiles.TileScheduler) the effects that can be split in strips
+    run in its threads.
+    """
+    if len(effects) == 0:
+        if profiler:
+            profiler.add("effects", 0.0)
+        return frame
+    phase_start = perf_counter()
+    if buffers is None:
+        buffers = get_effect_buffers(frame)
+    painted_frame = frame
+    same_input = not changed
+    index = 0
+    for group in group_effects(effects):
+        # Get the frame after processing the effect
+        dst = buffers[1] if painted_frame is buffers[0] else buffers[0]
+        started = perf_counter()
+        if len(group) > 1:
+            # Consecutive mirrors, in one pass. They are stateless, same_input holds
+            painted_frame = apply_pixel_maps(group, painted_frame, dst)
+        else:
+            effect = group[0]
+            painted_frame = effect.next_step(painted_frame, dst, tuple(effects[:index]),
+                                             same_input, tiles)
+            # The output is the same if the effect returned what it kept
+            same_input = same_input and effect.stateless and effect.is_working()
+        if profiler:
+            profiler.add_class("effect", "+".join(e.__class__.__name__ for e in group),
+                               perf_counter() - started)
+        index += len(group)
+    if painted_frame is not frame and not any(painted_frame is b for b in buffers):
+        # A frame kept by the effect (a reused output, Boomerang), that may change later
+        dst = buffers[0]
+        np.copyto(dst, painted_frame)
+        painted_frame = dst
+    if profiler:
+        profiler.add("effects", perf_counter() - phase_start)
+    return painted_frame
+
+
+def random_video(file_name=None, debug=False, seed=None, total_frames=None, generators_quantity=1,
+                 pipeline=False, segments=1, profile=None):
+    """
+    random_video
+
+    Generate a random video and save it to file_name.
+    With pipeline=True, the simulation and painting, the post effects and the encoding
+    of the frames run in three threads.
+    With segments > 1, the frames are split in that many segments painted by
+    different processes, see taor.segments. It takes precedence over pipeline.
+    The video is the same in every mode.
+    With profile, the time of every phase is saved to that file (.json or .csv),
+    see taor.profiler. Segments are not profiled, the video is painted in one process.
+    """
+    if seed:
+        np.random.seed(seed)
+
+    state = RandomVideo(file_name, debug, seed, total_frames, generators_quantity)
+    FPS = state.FPS
+    video = get_video(file_name, FPS, state.img_width, state.img_height)
+    if profile and segments > 1:
+        print("Profiling in one process, --segments is ignored")
+        segments = 1
+
+    # The segments are already painted in parallel
+    tiles = None
+    if config['effect_threads'] > 1 and segments <= 1:
+        tiles = TileScheduler(config['effect_threads'])
+    if config['paint_threads'] > 1 and segments <= 1:
+        state.paint_tiles = TileScheduler(config['paint_threads'])
+
+    profiler = None
+    write = video.write
+    if profile:
+        profiler = state.profiler = Profiler()
+        write = profiler.timed("write", video.write)
+    effects_function = apply_effects
+    if tiles or profiler:
+        effects_function = partial(apply_effects, profiler=profiler, tiles=tiles)
+
+    ####################################################################################
+    ####################################################################################
+    # Start the show \(._.)/
+    ####################################################################################
+    ####################################################################################
+    print("=== Timeline ===")
+    print_to_timeline(FPS, 0, "Start Video")
+
+    if segments > 1:
+        render_segments(state, apply_effects, video.write, total_frames, segments)
+    elif pipeline:
+        run_pipeline(state.step, effects_function, write, total_frames,
+                     config['pipeline_queue_size'])
+    else:
+        buffers = None
+        for frame_number in range(total_frames):
+            frame, effects, changed = state.step(frame_number)
+            if effects and buffers is None:
+                buffers = get_effect_buffers(frame)
+            ########################################
+            # Phase V: Actually Write Frame to Video
+            ########################################
+            write(effects_function(frame, effects, buffers, changed))
 
     print_to_timeline(FPS, total_frames, "End Video. Saved to %s" % file_name)
     video.release()
+    if tiles:
+        tiles.close()
+    if state.paint_tiles:
+        state.paint_tiles.close()
+
+    if profiler:
+        profiler.finish()
+        profiler.save(profile)
+        print("Profile saved to %s" % profile)
 
     if debug:
-        print("recycled_frames ", recycled_frames)
+        print("recycled_frames ", state.recycled_frames)
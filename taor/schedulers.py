@@ -27,6 +27,9 @@ class ScheduledEffect(object):
     def get_initial_frame(self):
         return self.initial_frame
 
+    def get_final_frame(self):
+        return self.final_frame
+
 
 class EffectScheduler(object):
     """
@@ -0,0 +1,137 @@
+"""
+segments module.
+Render a single long video by splitting its frames in contiguous segments, each
+one painted by its own worker process, and stitching them back in one file.
+
+A fast simulation only pass (RandomVideo.step with paint=False) runs over the
+whole video and takes snapshots of the state (and the global random state) at
+the start of every segment, so each worker can resume painting from there.
+Effects that use the pixels of previous frames (Boomerang) can not be resumed
+in the middle, so the worker starts painting at the beginning of the effect
+and discards the frames before its segment.
+
+Segments are saved with a lossless codec and stitched by the calling process,
+so the final video gets exactly the same frames as the sequential render.
+"""
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+SEGMENT_FOURCC = 'FFV1'
+
+
+def get_segment_bounds(total_frames, segments):
+    """
+    get_segment_bounds
+
+    Split range(total_frames) in contiguous (start, stop) segments of similar length
+    """
+    edges = np.linspace(0, total_frames, segments + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def take_snapshot(state):
+    return pickle.dumps((state, np.random.get_state()), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def render_segment(snapshot, warm_start, start, stop, file_name, fps, opencv_threads,
+                   apply_effects):
+    """
+    render_segment
+
+    Worker. Restore the snapshot taken before frame warm_start and paint until stop,
+    saving to file_name the frames from start on.
+    """
+    cv2.setNumThreads(opencv_threads)
+    state, random_state = pickle.loads(snapshot)
+    np.random.set_state(random_state)
+    state.resume()
+
+    fourcc = cv2.VideoWriter_fourcc(*SEGMENT_FOURCC)
+    video = cv2.VideoWriter(file_name, fourcc, float(fps), (state.img_width, state.img_height),
+                            True)
+    if not video.isOpened():
+        raise RuntimeError("Could not open %s with codec %s" % (file_name, SEGMENT_FOURCC))
+
+    # The timeline was already printed by the simulation pass
+    buffers = (np.empty((state.img_height, state.img_width, 3), np.uint8),
+               np.empty((state.img_height, state.img_width, 3), np.uint8))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for frame_number in range(warm_start, stop):
+            frame, effects, changed = state.step(frame_number)
+            painted_frame = apply_effects(frame, effects, buffers, changed)
+            if frame_number >= start:
+                video.write(painted_frame)
+    video.release()
+    return file_name
+
+
+def stitch_segment(file_name, frames, write):
+    segment = cv2.VideoCapture(file_name)
+    written = 0
+    while True:
+        ok, frame = segment.read()
+        if not ok:
+            break
+        write(frame)
+        written += 1
+    segment.release()
+    if written != frames:
+        raise RuntimeError("Segment %s has %d frames, expected %d" % (file_name, written, frames))
+
+
+def render_segments(state, apply_effects, write, total_frames, segments):
+    """
+    render_segments
+
+    Generate the frames of state (a RandomVideo) using one worker process per segment,
+    and hand them to write(frame) in order. apply_effects(frame, effects, buffers, changed)
+    is called by the workers, it must be a module level function.
+    """
+    bounds = get_segment_bounds(total_frames, segments)
+    starts = dict(bounds)
+    opencv_threads = max(1, (os.cpu_count() or 1) // len(bounds))
+
+    snapshots = {}
+    # (initial, final) frames of the effects that use past frames
+    history_effects = []
+
+    with tempfile.TemporaryDirectory(prefix="taor_segments_") as directory, \
+            ProcessPoolExecutor(len(bounds)) as pool:
+        futures = []
+        for frame_number in range(total_frames):
+            for scheduled in state.effects:
+                if scheduled.get_initial_frame() == frame_number \
+                        and scheduled.effect.uses_past_frames:
+                    history_effects.append((frame_number, scheduled.get_final_frame()))
+                    snapshots[frame_number] = take_snapshot(state)
+
+            if frame_number in starts:
+                warm_start = min([frame_number] + [
+                    initial for initial, final in history_effects
+                    if initial < frame_number < final
+                ])
+                if warm_start == frame_number:
+                    snapshots[frame_number] = take_snapshot(state)
+                file_name = os.path.join(directory, "segment%06d.avi" % frame_number)
+                futures.append(pool.submit(
+                    render_segment, snapshots[warm_start], warm_start, frame_number,
+                    starts[frame_number], file_name, state.FPS, opencv_threads, apply_effects
+                ))
+                # Snapshots before this frame are no longer needed
+                snapshots = {f: s for f, s in snapshots.items() if f >= warm_start}
+
+            _, effects, _ = state.step(frame_number, paint=False)
+            for effect in effects:
+                effect.skip_step()
+
+        for (start, stop), future in zip(bounds, futures):
+            file_name = future.result()
+            stitch_segment(file_name, stop - start, write)
+            os.remove(file_name)
@@ -0,0 +1,112 @@
+"""
+sprites module.
+Contains SpriteCache, the anti-aliased masks of the shapes that are painted
+again and again, see ArtifactStore.draw.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+import cv2
+import numpy as np
+
+from taor.artifacts import get_padding
+
+
+class SpriteCache(object):
+    """
+    SpriteCache class.
+    cv2.circle and cv2.ellipse build a thick anti-aliased outline from many small
+    anti-aliased polygons on every call. Generators keep the same size and thickness
+    for long stretches, so the coverage of each (kind, sizes, thickness) is rasterized
+    once, in a mask, and then blended with the color of every artifact that uses it.
+    Outlines that cross the border of the image are left to OpenCV, see
+    ArtifactStore.draw_sprite. The blend rounds the partially covered pixels on its
+    own, so they can be a few levels away from what OpenCV paints (up to 7 were
+    measured), and a faint pixel at the edge of the outline can be changed by one
+    and left as it was by the other. Videos painted with sprites are not the same
+    as the ones painted by OpenCV, so the cache is only used if sprite_cache_mb is set.
+
+    Fills and thin outlines are cheaper to paint with OpenCV than to blend, only
+    outlines of at least min_thickness pixels use sprites. The least recently used
+    sprites are dropped when they take more than max_bytes. The cache can be used
+    by many threads at the same time, see ArtifactStore.redraw.
+    """
+    def __init__(self, max_bytes, min_thickness=2):
+        self.max_bytes = max_bytes
+        self.min_thickness = min_thickness
+        # key -> (mask, inverse mask, center)
+        self.sprites = OrderedDict()
+        self.bytes = 0
+        self.lock = Lock()
+
+    def __getstate__(self):
+        # The sprites can always be rasterized again
+        state = self.__dict__.copy()
+        state['sprites'] = OrderedDict()
+        state['bytes'] = 0
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def wants(self, thickness):
+        return thickness >= self.min_thickness
+
+    def get(self, key, sizes, thickness, draw_mask):
+        """
+        get
+
+        Sprite of key, for a shape with the given sizes (half width and height) and
+        thickness. If it is not cached yet, draw_mask(mask, center) paints the shape
+        in 255 on a single channel mask. Returns None if the sprite does not fit
+        in the cache.
+        """
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                return sprite
+
+        pad = int(get_padding(thickness))
+        center = (sizes[0] + pad, sizes[1] + pad)
+        nbytes = 2 * 3 * (2 * center[0] + 1) * (2 * center[1] + 1)
+        if nbytes > self.max_bytes:
+            return None
+        mask = np.zeros((2 * center[1] + 1, 2 * center[0] + 1), np.uint8)
+        draw_mask(mask, center)
+        mask = cv2.merge([mask, mask, mask])
+        sprite = (mask, 255 - mask, center)
+
+        with self.lock:
+            if key in self.sprites:
+                # Rasterized by another thread in the meantime
+                return self.sprites[key]
+            self.sprites[key] = sprite
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (old_mask, _, _) = self.sprites.popitem(last=False)
+                self.bytes -= 2 * old_mask.nbytes
+        return sprite
+
+    def blend(self, img, sprite, origin, color):
+        """
+        blend
+
+        Paint sprite on img centered at origin, with color, clipped to img
+        """
+        mask, inverse, center = sprite
+        img_height, img_width = img.shape[:2]
+        x0, y0 = origin[0] - center[0], origin[1] - center[1]
+        x1, y1 = x0 + mask.shape[1], y0 + mask.shape[0]
+        cx0, cy0 = max(x0, 0), max(y0, 0)
+        cx1, cy1 = min(x1, img_width), min(y1, img_height)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        region = img[cy0:cy1, cx0:cx1]
+        part = (slice(cy0 - y0, cy1 - y0), slice(cx0 - x0, cx1 - x0))
+        # region * (1 - alpha) + color * alpha
+        kept = cv2.multiply(region, inverse[part], scale=1 / 255)
+        added = cv2.multiply(mask[part], (color[0], color[1], color[2], 0), scale=1 / 255)
+        cv2.add(kept, added, dst=region)
@@ -0,0 +1,49 @@
+"""
+tiles module.
+Contains TileScheduler, that splits the post effects of a frame in horizontal
+strips processed by a pool of threads.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TileScheduler(object):
+    """
+    TileScheduler class.
+    OpenCV and numpy release the GIL, so the strips of a frame are really processed
+    at the same time. Each strip reads its rows plus the halo of the effect, see
+    PostEffect.process_region, so the result is the same as processing the whole frame.
+    """
+    def __init__(self, threads, strips=None, min_rows=32):
+        self.threads = threads
+        self.strips = strips or threads
+        # Strips smaller than this are not worth the halo and the scheduling
+        self.min_rows = min_rows
+        self.pool = ThreadPoolExecutor(threads)
+
+    def get_strips(self, height):
+        """
+        get_strips
+
+        (y0, y1) rows of each strip, end exclusive
+        """
+        strips = max(1, min(self.strips, height // self.min_rows))
+        bounds = [height * i // strips for i in range(strips + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def map(self, function, height):
+        """
+        map
+
+        Call function(y0, y1) for every strip of a frame of the given height, and wait
+        until all of them finished
+        """
+        strips = self.get_strips(height)
+        if len(strips) == 1:
+            function(*strips[0])
+            return
+        futures = [self.pool.submit(function, y0, y1) for y0, y1 in strips]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.pool.shutdown()
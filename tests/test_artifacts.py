@@ -0,0 +1,128 @@
+import numpy as np
+
+from taor.artifacts import ArtifactStore, CIRCLE, ELLIPSE
+from taor.background import Background
+from taor.shapes import Circle, Ellipse, Rectangle
+from taor.sprites import SpriteCache
+from taor.tiles import TileScheduler
+
+HEIGHT, WIDTH = 240, 426
+
+
+def random_columns(rng, quantity):
+    """
+    Small and big shapes, filled and outlined, many of them across the edges
+    """
+    big = rng.random(quantity) < 0.2
+    sizes = np.where(big[:, None], rng.integers(50, 300, (quantity, 2)),
+                     rng.integers(2, 40, (quantity, 2)))
+    kind = rng.integers(0, 3, quantity).astype(np.int8)
+    sizes[kind == CIRCLE, 1] = sizes[kind == CIRCLE, 0]
+    filled = rng.random(quantity) < 0.5
+    return dict(
+        kind=kind, origin=rng.integers(-200, (WIDTH + 200, HEIGHT + 200), (quantity, 2)),
+        sizes=sizes, color=rng.integers(0, 256, (quantity, 3)), has_color=filled,
+        outline=rng.integers(0, 256, (quantity, 3)),
+        has_outline=~filled | (rng.random(quantity) < 0.3),
+        thickness=np.where(filled, -1, rng.choice([1, 2, 3, 7, 15, 30], quantity)),
+        lifespan=10,
+    )
+
+
+def random_scene(seed, quantity=300, sprites=False):
+    rng = np.random.default_rng(seed)
+    artifacts = ArtifactStore(sprites=SpriteCache(1 << 24) if sprites else None)
+    artifacts.extend(random_columns(rng, quantity))
+    background = Background((HEIGHT, WIDTH), rng.integers(0, 256, 3).tolist())
+    if seed % 3 == 0:
+        background.set_pixels(rng.integers(0, 256, (HEIGHT, WIDTH, 3), np.uint8))
+    return artifacts, background
+
+
+def full_redraw(artifacts, background):
+    frame = background.new_frame()
+    artifacts.draw(frame, artifacts.visible_rows((WIDTH, HEIGHT)))
+    return frame
+
+
+def test_draw_is_the_same_as_the_shapes():
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        shapes = []
+        for _ in range(40):
+            origin = [rng.randint(-60, WIDTH + 60), rng.randint(-60, HEIGHT + 60)]
+            color = tuple(int(c) for c in rng.randint(0, 256, 3))
+            if rng.rand() < 0.6:
+                style = (color, None, -1)
+            else:
+                style = (None, color, rng.randint(1, 11))
+            kind = rng.randint(3)
+            if kind == 0:
+                shapes.append(Rectangle(origin, (rng.randint(5, 160),) * 2, *style))
+            elif kind == 1:
+                shapes.append(Circle(origin, rng.randint(5, 160), *style))
+            else:
+                shapes.append(Ellipse(origin, (rng.randint(5, 160), rng.randint(5, 160)),
+                                      *style))
+        expected = np.full((HEIGHT, WIDTH, 3), 40, np.uint8)
+        for shape in shapes:
+            if shape.will_paint((WIDTH, HEIGHT)):
+                shape.draw(expected)
+        artifacts = ArtifactStore()
+        artifacts.extend(shapes)
+        frame = np.full((HEIGHT, WIDTH, 3), 40, np.uint8)
+        artifacts.draw(frame, artifacts.visible_rows((WIDTH, HEIGHT)))
+        assert np.array_equal(frame, expected)
+
+
+def test_repair_is_a_full_redraw():
+    for seed in range(12):
+        artifacts, background = random_scene(seed, sprites=seed % 2)
+        expected = full_redraw(artifacts, background)
+        frame = np.zeros_like(expected)
+        strips = 6
+        for strip in range(strips):
+            y0, y1 = HEIGHT * strip // strips, HEIGHT * (strip + 1) // strips
+            artifacts.repair(frame, background, (0, y0, WIDTH, y1), 16)
+        assert np.array_equal(frame, expected), seed
+
+
+def test_redraw_in_strips_is_a_full_redraw():
+    tiles = TileScheduler(3, strips=6)
+    try:
+        for seed in range(12):
+            artifacts, background = random_scene(seed, sprites=seed % 2)
+            expected = full_redraw(artifacts, background)
+            frame = np.zeros_like(expected)
+            artifacts.redraw(frame, background, artifacts.visible_rows((WIDTH, HEIGHT)), tiles)
+            assert np.array_equal(frame, expected), seed
+    finally:
+        tiles.close()
+
+
+def test_sprites_are_close_to_opencv():
+    rng = np.random.default_rng(1)
+    quantity = 500
+    kind = rng.integers(1, 3, quantity).astype(np.int8)
+    sizes = np.repeat(rng.integers(3, 60, (quantity, 1)), 2, axis=1)
+    sizes[kind == ELLIPSE, 1] //= 2
+    columns = dict(kind=kind, origin=rng.integers(-60, (WIDTH + 60, HEIGHT + 60), (quantity, 2)),
+                   sizes=sizes, color=None, outline=rng.integers(0, 256, (quantity, 3)),
+                   thickness=rng.choice([2, 5, 9], quantity), lifespan=10)
+    opencv = ArtifactStore()
+    opencv.extend(columns)
+    sprites = ArtifactStore(sprites=SpriteCache(1 << 24))
+    sprites.extend(columns)
+    x0, y0, x1, y1 = opencv.get_bounds(np.arange(quantity)).T
+    clipped = (x0 < 0) | (y0 < 0) | (x1 > WIDTH) | (y1 > HEIGHT)
+    background = np.full((HEIGHT, WIDTH, 3), 90, np.uint8)
+    for row in range(quantity):
+        expected, frame = background.copy(), background.copy()
+        opencv.draw(expected, [row])
+        sprites.draw(frame, [row])
+        if clipped[row]:
+            # Left to OpenCV
+            assert np.array_equal(frame, expected)
+        else:
+            # Only the partially covered pixels round on their own
+            assert np.abs(frame.astype(int) - expected).max() <= 7
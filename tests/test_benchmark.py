@@ -0,0 +1,10 @@
+from taor.benchmark import CLASSES, create_bg_change, create_effect, create_generator
+
+
+def test_classes_match_the_factories():
+    create = {"generator": create_generator, "background": create_bg_change,
+              "effect": create_effect}
+    for kind, classes in CLASSES.items():
+        for option, option_class in classes.items():
+            subject = create[kind](option, (72, 128), 1)
+            assert subject[0].__class__ is option_class
@@ -0,0 +1,170 @@
+import numpy as np
+from numpy.random import choice, randint
+
+from taor.background import Background
+from taor.bg_changes import (ConvertChange, CurtainChange, GridChange, InstantChange,
+                             RandomNoiseChange, RandomPixelChange)
+from taor.noise import NoiseSource
+
+FPS = 4
+SHAPE = (30, 52)
+HEIGHT, WIDTH = SHAPE
+
+
+def random_pixel_slices():
+    """
+    The slices of the first version of each change, same random numbers
+    """
+    max_ppf = (WIDTH * HEIGHT) / (FPS * 2)
+    min_ppf = (WIDTH * HEIGHT) / (FPS * 5)
+    points_per_frame = randint(min_ppf, max_ppf+1)
+    coordinates = []
+    for w in range(WIDTH):
+        for h in range(HEIGHT):
+            coordinates.append([slice(h, h+1), slice(w, w+1)])
+    coordinates = np.array(coordinates)
+    np.random.shuffle(coordinates)
+    return coordinates, points_per_frame
+
+
+def grid_slices():
+    div_x = randint(1, 9)
+    div_y = randint(1, 9)
+    jump_y = round(HEIGHT/div_y)
+    jump_x = round(WIDTH/div_x)
+    coordinates = []
+    for row in range(div_y):
+        for col in range(div_x):
+            y_final = HEIGHT if row == div_y-1 else (row+1)*jump_y
+            x_final = WIDTH if col == div_x-1 else (col+1)*jump_x
+            coordinates.append([slice(int(row*jump_y), int(y_final+1)),
+                                slice(int(col*jump_x), int(x_final+1))])
+    coordinates = np.array(coordinates)
+    np.random.shuffle(coordinates)
+    return coordinates, 1
+
+
+def curtain_slices():
+    direction = choice(["ud", "du", "lr", "rl"])
+    lines = HEIGHT if direction in ["ud", "du"] else WIDTH
+    lines_per_frame = randint(lines / (FPS * 5), lines / (FPS * 2) + 1)
+    coordinates = []
+    if direction in ["ud", "du"]:
+        for c in range(0, HEIGHT, lines_per_frame):
+            coordinates.append([slice(c, c+lines_per_frame), slice(0, WIDTH + 1)])
+    else:
+        for r in range(0, WIDTH, lines_per_frame):
+            coordinates.append([slice(0, HEIGHT + 1), slice(r, r+lines_per_frame)])
+    coordinates = np.array(coordinates)
+    if direction in ["du", "rl"]:
+        coordinates = coordinates[::-1]
+    return coordinates, 1
+
+
+def instant_slices():
+    return [[slice(0, HEIGHT+1), slice(0, WIDTH+1)]], 1
+
+
+def test_reveal_ranks_are_the_slices_one_after_another():
+    for change_class, get_slices in [(InstantChange, instant_slices),
+                                     (RandomPixelChange, random_pixel_slices),
+                                     (GridChange, grid_slices),
+                                     (CurtainChange, curtain_slices)]:
+        for seed in range(10):
+            target_color = (seed * 20, 255 - seed, 7)
+            np.random.seed(seed)
+            change = change_class(FPS, SHAPE, target_color)
+            np.random.seed(seed)
+            coordinates, points_per_frame = get_slices()
+
+            background = Background(SHAPE, (1, 2, 3))
+            expected = background.new_frame()
+            for step in range(len(coordinates) + 2):
+                assert change.is_working()
+                change.next_step(background)
+                # The first version, one slice at a time
+                working = True
+                for _ in range(points_per_frame):
+                    if len(coordinates) > 0:
+                        sy, sx = coordinates[0]
+                        expected[sy, sx, :] = target_color
+                        coordinates = coordinates[1:]
+                    else:
+                        working = False
+                assert np.array_equal(background.new_frame(), expected), (change_class, seed)
+                assert change.is_working() == working
+                if not working:
+                    break
+            assert change.has_finished()
+            assert background.is_solid()
+
+
+def test_convert_stays_solid_with_the_colors_of_a_full_frame():
+    for seed in range(10):
+        np.random.seed(seed)
+        current_color, target_color = np.random.randint(0, 256, (2, 3)).tolist()
+        change = ConvertChange(FPS, SHAPE, target_color, current_color)
+        background = Background(SHAPE, current_color)
+        # The first version, a frame of float16 pixels
+        pseudo_frame = np.zeros((HEIGHT, WIDTH, 3), np.float16)
+        pseudo_frame[:, :] = current_color
+        for _ in range(change.frames):
+            change.next_step(background)
+            pseudo_frame[:, :] += change.change_per_frame
+            pseudo_frame[pseudo_frame > 255] = 255
+            assert background.is_solid()
+            assert np.array_equal(background.new_frame(), pseudo_frame.round().astype(np.uint8))
+        change.next_step(background)
+        assert change.has_finished() and background.get_color() == tuple(target_color)
+
+
+def test_noise_is_the_same_for_the_same_seed():
+    for bank_size in [0, 3]:
+        noise, same = NoiseSource(SHAPE, 5, bank_size), NoiseSource(SHAPE, 5, bank_size)
+        other = NoiseSource(SHAPE, 6, bank_size)
+        first = noise.next_frame()
+        previous = first.copy()
+        same.next_frame()
+        other.next_frame()
+        for _ in range(10):
+            frame = noise.next_frame()
+            assert frame.shape == (HEIGHT, WIDTH, 3) and frame.dtype == np.uint8
+            assert np.array_equal(same.next_frame(), frame)
+            assert not np.array_equal(other.next_frame(), frame)
+            # Same memory, new noise
+            assert np.shares_memory(frame, first)
+            assert not np.array_equal(frame, previous)
+            previous = frame.copy()
+
+
+def test_noise_bank_frames_are_windows_of_the_planes():
+    margin = 4
+    noise = NoiseSource(SHAPE, 9, bank_size=2, bank_margin=margin)
+    for _ in range(20):
+        frame = noise.next_frame()
+        windows = []
+        for plane in noise.bank:
+            for y in range(margin + 1):
+                for x in range(margin + 1):
+                    window = plane[y:y + HEIGHT, x:x + WIDTH]
+                    windows += [window, window[::-1], window[:, ::-1], window[::-1, ::-1]]
+        assert len(noise.bank) <= 2
+        assert any(np.array_equal(frame, window) for window in windows)
+
+
+def test_noise_change_keeps_the_noise_in_the_flash_frames():
+    np.random.seed(3)
+    change = RandomNoiseChange(FPS, SHAPE, (9, 9, 9), bank_size=2)
+    assert len(change.flash_frames)
+    background = Background(SHAPE, (0, 0, 0))
+    previous = background.new_frame()
+    for frame in range(change.frames):
+        change.next_step(background)
+        pixels = background.new_frame()
+        if frame in change.flash_frames:
+            assert np.array_equal(pixels, previous)
+        else:
+            assert not np.array_equal(pixels, previous)
+        previous = pixels
+    change.next_step(background)
+    assert change.has_finished() and background.get_color() == (9, 9, 9)
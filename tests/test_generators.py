@@ -0,0 +1,104 @@
+import numpy as np
+
+from taor.artifacts import ArtifactStore
+from taor.generators import Explosion, GeneratorBatch, GeneratorFactory, StainGrid
+
+
+def create_bursts(burst_frames, generator_type, quantity):
+    np.random.seed(7)
+    factory = GeneratorFactory(1280)
+    factory.config["burst_frames"] = burst_frames
+    factory.config["p_generators"] = [1 if option == generator_type else 0
+                                      for option in factory.config["s_generators"]]
+    return [factory.create_generator() for _ in range(quantity)]
+
+
+def test_burst_emits_quantity_in_burst_frames():
+    for generator_type, generator_class in [("x", Explosion), ("s", StainGrid)]:
+        for generator in create_bursts(24, generator_type, 5):
+            assert isinstance(generator, generator_class)
+            emitted = sum(len(generator.generate()["origin"]) for _ in range(24))
+            assert emitted == generator.s["quantity"]
+            # One per frame once the quantity is used up
+            assert len(generator.generate()["origin"]) == 1
+
+
+def test_batch_burst_totals():
+    np.random.seed(11)
+    factory = GeneratorFactory(1280)
+    factory.config["burst_frames"] = 24
+    generators = [factory.create_generator() for _ in range(40)]
+    quantities = [generator.s["quantity"] for generator in generators
+                  if generator.s["burst"] > 1]
+    assert quantities
+    batch = GeneratorBatch(generators)
+
+    total = 0
+    for frame in range(48):
+        columns, owners = batch.generate()
+        assert len(owners) == len(columns["origin"])
+        assert np.all(np.diff(owners) >= 0)
+        total += len(owners)
+        if frame == 23:
+            assert total == sum(quantities) + 24 * (len(generators) - len(quantities))
+    # Every generator is back to one artifact per frame
+    assert len(owners) == len(generators)
+
+
+def create_generators(seed, quantity, burst_frames=None):
+    np.random.seed(seed)
+    factory = GeneratorFactory(1280)
+    factory.config["burst_frames"] = burst_frames
+    return [factory.create_generator() for _ in range(quantity)]
+
+
+def assert_same_artifacts(expected, artifacts):
+    assert len(expected) == len(artifacts)
+    size = len(artifacts)
+    for name in ["kind", "origin", "sizes", "has_color", "has_outline", "thickness",
+                 "lifespan"]:
+        assert np.array_equal(getattr(expected, name)[:size], getattr(artifacts, name)[:size])
+    has_color = expected.has_color[:size]
+    has_outline = expected.has_outline[:size]
+    assert np.array_equal(expected.color[:size][has_color], artifacts.color[:size][has_color])
+    assert np.array_equal(expected.outline[:size][has_outline],
+                          artifacts.outline[:size][has_outline])
+
+
+def test_batch_is_the_same_as_each_generator():
+    for seed, quantity, burst_frames in [(1, 1, None), (2, 3, None), (3, 17, 48), (4, 40, None)]:
+        one_by_one = create_generators(seed, quantity, burst_frames)
+        generators = create_generators(seed, quantity, burst_frames)
+        batch = GeneratorBatch(generators)
+        expected, artifacts = ArtifactStore(), ArtifactStore()
+        moves = np.random.RandomState(seed)
+        for _ in range(150):
+            if moves.rand() < 0.05:
+                index = moves.randint(quantity)
+                x, y = moves.randint(0, 1280, 2).tolist()
+                one_by_one[index].move_origin(x, y)
+                generators[index].move_origin(x, y)
+            for generator in one_by_one:
+                expected.extend(generator.generate())
+            columns, owners = batch.generate()
+            assert len(owners) == len(columns["origin"])
+            artifacts.extend(columns)
+        assert_same_artifacts(expected, artifacts)
+
+
+def test_burst_is_the_same_as_single_steps():
+    for generator_type in ["x", "s"]:
+        for burst in [7, 300]:
+            single, = create_bursts(None, generator_type, 1)
+            bursting, = create_bursts(None, generator_type, 1)
+            bursting.s["burst"] = burst
+            # Never used up, see test_burst_emits_quantity_in_burst_frames
+            bursting.s["quantity"] = 10 ** 9
+            expected, artifacts = ArtifactStore(), ArtifactStore()
+            for _ in range(4):
+                single.move_origin(300, 200)
+                bursting.move_origin(300, 200)
+                for _ in range(burst):
+                    expected.extend(single.generate())
+                artifacts.extend(bursting.generate())
+            assert_same_artifacts(expected, artifacts)
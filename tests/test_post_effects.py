@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+
+from taor.post_effects import (BlackAndWhite, Brightness, ColorThreshold, Contour, GaussianBlur,
+                               GrayScale, Mirror, MirrorBox, apply_pixel_maps, group_effects)
+from taor.tiles import TileScheduler
+
+FPS = 24
+# The halves of the mirrors are only the same size in even sized frames
+SHAPE = (240, 426)
+
+
+def get_image(seed):
+    rng = np.random.default_rng(seed)
+    height, width = SHAPE
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = rng.integers(0, 256, 3).tolist()
+    for _ in range(60):
+        center = tuple(int(c) for c in rng.integers(0, (width, height)))
+        color = rng.integers(0, 256, 3).tolist()
+        cv2.circle(image, center, int(rng.integers(5, 80)), color, -1, cv2.LINE_AA)
+    return image
+
+
+def mirror_axis(image, axis):
+    """
+    The mirror of the first version, in place
+    """
+    height, width = SHAPE
+    if axis == "h":
+        box, flip_method, paste = (0, 0, height // 2, width), 0, (height // 2, 0, height, width)
+    elif axis == "v":
+        box, flip_method, paste = (0, 0, height, width // 2), 1, (0, width // 2, height, width)
+    elif axis == "-h":
+        box, flip_method, paste = (height // 2, 0, height, width), 0, (0, 0, height // 2, width)
+    else:
+        box, flip_method, paste = (0, width // 2, height, width), 1, (0, 0, height, width // 2)
+    flipped = cv2.flip(image[box[0]:box[2], box[1]:box[3]], flip_method)
+    image[paste[0]:paste[2], paste[1]:paste[3]] = flipped
+
+
+def mirror_box(image, axis, box):
+    """
+    The mirror box of the first version, in place
+    """
+    if box[0] == box[2] or box[1] == box[3]:
+        # The factory can choose an empty box, cv2.flip returns None for it
+        return
+    flipped = cv2.flip(image[box[0]:box[2], box[1]:box[3]], 0 if axis == "h" else 1)
+    image[box[0]:box[2], box[1]:box[3]] = flipped
+
+
+def random_mirror(rng):
+    height, width = SHAPE
+    if rng.random() < 0.5:
+        axes = [None, "h", "v", "-h", "-v"]
+        axis_1, axis_2 = (axes[i] for i in rng.integers(0, 5, 2))
+        effect = Mirror(FPS, SHAPE, axis_1, axis_2)
+
+        def reference(image):
+            for axis in (axis_1, axis_2):
+                if axis:
+                    mirror_axis(image, axis)
+    else:
+        axis = ["h", "v"][rng.integers(2)]
+        x0, y0 = int(rng.integers(width)), int(rng.integers(height))
+        box = (y0, x0, int(rng.integers(y0, height + 1)), int(rng.integers(x0, width + 1)))
+        effect = MirrorBox(FPS, SHAPE, axis, box)
+
+        def reference(image):
+            mirror_box(image, axis, box)
+    return effect, reference
+
+
+def test_fused_mirrors_are_the_mirrors_one_after_another():
+    rng = np.random.default_rng(0)
+    for seed in range(60):
+        image = get_image(seed)
+        mirrors = [random_mirror(rng) for _ in range(int(rng.integers(1, 5)))]
+        expected = image.copy()
+        for _, reference in mirrors:
+            reference(expected)
+
+        effects = [effect for effect, _ in mirrors]
+        groups = group_effects(effects)
+        assert groups == [effects]
+        dst = np.empty_like(image)
+        assert np.array_equal(apply_pixel_maps(effects, image, dst), expected)
+        # One at a time
+        frame = image
+        for effect in effects:
+            frame = effect.next_step(frame, np.empty_like(frame))
+        assert np.array_equal(frame, expected)
+
+
+def test_color_threshold_is_the_first_version():
+    for seed in range(5):
+        image = get_image(seed)
+        color = tuple(int(c) for c in np.random.default_rng(seed).integers(0, 256, 3))
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY, 11, 2)
+        expected = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
+        expected[np.where((expected == [0, 0, 0]).all(axis=2))] = color
+
+        effect = ColorThreshold(FPS, SHAPE, color)
+        assert np.array_equal(effect.next_step(image, np.empty_like(image)), expected)
+
+
+def test_brightness_is_the_first_version():
+    image = get_image(1)
+    for diff in [40, -40]:
+        np.random.seed(3)
+        effect = Brightness(FPS, SHAPE, diff)
+        effect.frames = 100
+        current = 0
+        for frame in range(effect.frames):
+            expected = np.uint8(np.clip(np.int32(image) + current, 0, 255))
+            assert np.array_equal(effect.next_step(image, np.empty_like(image)), expected)
+            if frame <= abs(diff):
+                current += np.sign(diff)
+            elif effect.frames - frame <= abs(diff):
+                current -= np.sign(diff)
+
+
+def test_strips_are_the_same_as_the_whole_frame():
+    tiles = TileScheduler(3, strips=5)
+    try:
+        image = get_image(2)
+        for create in [lambda: GrayScale(FPS, SHAPE), lambda: BlackAndWhite(FPS, SHAPE),
+                       lambda: ColorThreshold(FPS, SHAPE, (10, 200, 30)),
+                       lambda: GaussianBlur(FPS, SHAPE, 31),
+                       lambda: Brightness(FPS, SHAPE, -30),
+                       lambda: Contour(FPS, SHAPE, (0, 0, 255), 3)]:
+            whole, tiled = create(), create()
+            for _ in range(3):
+                expected = whole.next_step(image, np.empty_like(image))
+                assert np.array_equal(tiled.next_step(image, np.empty_like(image), tiles=tiles),
+                                      expected)
+    finally:
+        tiles.close()
+
+
+def test_stateless_effects_keep_their_output_only_for_the_same_input():
+    image = get_image(4)
+    effect = GaussianBlur(FPS, SHAPE, 15)
+    expected = cv2.GaussianBlur(image, (15, 15), 0)
+    dst = np.empty_like(image)
+    assert effect.next_step(image, dst) is dst
+    kept = effect.next_step(image, dst, same_input=True)
+    assert kept is not dst and np.array_equal(kept, expected)
+    assert effect.next_step(image, dst, same_input=True) is kept
+    changed = image[::-1].copy()
+    assert np.array_equal(effect.next_step(changed, dst), cv2.GaussianBlur(changed, (15, 15), 0))
@@ -0,0 +1,61 @@
+import numpy as np
+
+from taor.artifacts import ArtifactStore
+from taor.background import Background
+from taor.randomvideo import clip_bounds, crosses_edges, get_uncovered_bounds, shift_frame
+
+HEIGHT, WIDTH = 360, 640
+
+
+def random_store(seed, quantity=60):
+    """
+    Big shapes, many of them across the edges of the frame
+    """
+    rng = np.random.default_rng(seed)
+    kind = rng.integers(0, 3, quantity).astype(np.int8)
+    sizes = rng.integers(30, 400, (quantity, 2))
+    sizes[kind == 1, 1] = sizes[kind == 1, 0]
+    filled = rng.random(quantity) < 0.4
+    artifacts = ArtifactStore()
+    artifacts.extend(dict(
+        kind=kind, origin=rng.integers(-450, (WIDTH + 450, HEIGHT + 450), (quantity, 2)),
+        sizes=sizes, color=rng.integers(0, 256, (quantity, 3)), has_color=filled,
+        outline=rng.integers(0, 256, (quantity, 3)), has_outline=~filled,
+        thickness=np.where(filled, -1, rng.choice([1, 2, 5, 10, 20, 30], quantity)),
+        lifespan=10,
+    ))
+    background = Background((HEIGHT, WIDTH), rng.integers(0, 256, 3).tolist())
+    shift = tuple(int(value) for value in rng.integers(-3, 4, 2))
+    return artifacts, background, shift if shift != (0, 0) else (1, 0)
+
+
+def full_redraw(artifacts, background):
+    frame = background.new_frame()
+    artifacts.draw(frame, artifacts.visible_rows((WIDTH, HEIGHT)))
+    return frame
+
+
+def test_shift_and_repair_is_a_full_redraw():
+    # The first four were different next to the frame edges with a fixed band
+    for seed in [114, 242, 466, 532] + list(range(20)):
+        artifacts, background, shift = random_store(seed)
+        frame = full_redraw(artifacts, background)
+
+        # Same as the translate path of RandomVideo.step
+        rows = np.arange(len(artifacts))
+        visible_before = artifacts.will_paint((WIDTH, HEIGHT), rows)
+        clipped_before = visible_before & crosses_edges(
+            artifacts.get_bounds(rows), WIDTH, HEIGHT)
+        artifacts.move_yx(*shift)
+        visible = artifacts.will_paint((WIDTH, HEIGHT), rows)
+        bounds = artifacts.get_bounds(rows)
+        repaint = ((visible_before != visible) | clipped_before |
+                   (visible & crosses_edges(bounds, WIDTH, HEIGHT)))
+        damaged = clip_bounds(np.vstack([
+            bounds[repaint], get_uncovered_bounds(shift[0], shift[1], WIDTH, HEIGHT)
+        ]), WIDTH, HEIGHT)
+
+        shift_frame(frame, *shift)
+        for damaged_bounds in damaged:
+            artifacts.repair(frame, background, damaged_bounds, 16)
+        assert np.array_equal(frame, full_redraw(artifacts, background)), seed
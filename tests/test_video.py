@@ -0,0 +1,72 @@
+import contextlib
+import hashlib
+import io
+
+import numpy as np
+import pytest
+
+import taor.randomvideo as randomvideo
+
+# Changes of background and effects every few seconds, and global movement
+BUSY = dict(img_width=426, img_height=240, min_bg_change_wait=1, max_bg_change_wait=4,
+            min_effect_wait=1, max_effect_wait=3, max_effects=3, p_movement=[0.2, 0.4, 0.4])
+# Every frame painted from scratch and every artifact kept
+PLAIN = dict(damage_tracking=False, translate_on_movement=False, skip_off_canvas=False)
+CASES = [(3, 200, 1), (5, 200, 3), (8, 150, 8)]
+
+
+class FrameHashes(object):
+    def __init__(self):
+        self.hashes = []
+
+    def write(self, frame):
+        self.hashes.append(hashlib.md5(np.ascontiguousarray(frame).tobytes()).hexdigest())
+
+    def release(self):
+        pass
+
+
+def render(monkeypatch, case, settings, **kwargs):
+    seed, frames, generators = case
+    for name, value in dict(BUSY, **settings).items():
+        monkeypatch.setitem(randomvideo.config, name, value)
+    video = FrameHashes()
+    monkeypatch.setattr(randomvideo, "get_video", lambda *args: video)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        randomvideo.random_video("test.avi", seed=seed, total_frames=frames,
+                                 generators_quantity=generators, **kwargs)
+    assert len(video.hashes) == frames
+    return video.hashes, output.getvalue()
+
+
+plain_renders = {}
+
+
+def render_plain(monkeypatch, case):
+    if case not in plain_renders:
+        plain_renders[case] = render(monkeypatch, case, PLAIN)
+    return plain_renders[case]
+
+
+@pytest.mark.parametrize("case", CASES)
+@pytest.mark.parametrize("settings, kwargs", [
+    ({}, {}),
+    ({}, {"pipeline": True}),
+    ({}, {"segments": 3}),
+    ({"effect_threads": 3}, {}),
+    ({"paint_threads": 4}, {}),
+    ({"effect_threads": 2, "paint_threads": 3}, {"pipeline": True}),
+])
+def test_same_frames_as_plain(monkeypatch, case, settings, kwargs):
+    frames, timeline = render(monkeypatch, case, settings, **kwargs)
+    plain_frames, plain_timeline = render_plain(monkeypatch, case)
+    assert timeline == plain_timeline
+    assert frames == plain_frames
+
+
+@pytest.mark.parametrize("case", CASES[:2])
+def test_sprites_same_frames_in_every_mode(monkeypatch, case):
+    sprites = {"sprite_cache_mb": 16}
+    frames, _ = render(monkeypatch, case, sprites)
+    assert render(monkeypatch, case, dict(sprites, paint_threads=4), pipeline=True)[0] == frames
+    assert render(monkeypatch, case, sprites, segments=2)[0] == frames